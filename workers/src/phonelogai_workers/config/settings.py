@@ -22,6 +22,9 @@ class Settings(BaseSettings):
     # ML Model Configuration
     model_cache_dir: str = "/tmp/phonelogai_models"
     max_model_cache_size_mb: int = 1000
+    # Fit the field mapper on worker startup when no saved model exists;
+    # otherwise it is trained offline via phonelogai_workers.ml.train_field_mapper
+    train_field_mapper_on_startup: bool = False
     
     # Processing Configuration
     max_file_size_mb: int = 100
@@ -34,6 +37,8 @@ class Settings(BaseSettings):
     target_100k_processing_time_seconds: int = 300  # 5 minutes
     target_1m_processing_time_seconds: int = 1800   # 30 minutes
     max_memory_usage_mb: int = 2048
+    # L2 cache size used to size processing batches; detected from sysfs if unset
+    l2_cache_bytes: Optional[int] = None
     
     # OCR Configuration
     tesseract_cmd: Optional[str] = None  # Will use system default if None
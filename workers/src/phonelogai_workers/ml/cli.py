@@ -276,6 +276,11 @@ async def main():
     except Exception as e:
         print(f"Error: {str(e)}")
         return 1
+    
+    finally:
+        # Template discovery saves to the database in the background;
+        # asyncio.run would cancel those writes when main returns
+        await template_manager.wait_for_pending_writes()
 
 
 if __name__ == "__main__":
@@ -8,40 +8,174 @@ This module implements machine learning models to automatically detect:
 - Confidence scoring for classification accuracy
 """
 import os
+
+# Parallelism is coordinated at the joblib level (one fit per core), so keep
+# BLAS/OpenMP single-threaded per worker. Must run before numpy/sklearn load.
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+os.environ.setdefault("MKL_NUM_THREADS", "1")
+os.environ.setdefault("OPENBLAS_NUM_THREADS", "1")
+
+import copy
+import csv
 import pickle
 import re
 import hashlib
-from typing import Dict, List, Tuple, Optional, Any, Union
+import tempfile
+from functools import lru_cache
+from itertools import islice
+from typing import Dict, List, Tuple, Optional, Any, Union, FrozenSet
 from pathlib import Path
+from dataclasses import dataclass
 import structlog
 import numpy as np
 import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer, CountVectorizer
+from sklearn.feature_extraction.text import (
+    TfidfVectorizer, HashingVectorizer, TfidfTransformer
+)
 from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier, VotingClassifier
-from sklearn.naive_bayes import MultinomialNB
+from sklearn.naive_bayes import ComplementNB
 from sklearn.linear_model import LogisticRegression
-from sklearn.svm import SVC
-from sklearn.pipeline import Pipeline, FeatureUnion
-from sklearn.model_selection import train_test_split, cross_val_score, GridSearchCV
+from sklearn.pipeline import Pipeline, FeatureUnion, make_pipeline
+from sklearn.model_selection import (
+    train_test_split, cross_val_score, cross_validate, GridSearchCV, RandomizedSearchCV
+)
 from sklearn.metrics import classification_report, confusion_matrix, accuracy_score
 from sklearn.preprocessing import StandardScaler
+from scipy.stats import loguniform
 import joblib
-from collections import Counter
+from collections import Counter, OrderedDict
 
 from ..config import settings
 from ..utils.database import db_manager
+from .patterns import NUMERIC_RE
+
+# Cache keys only need a fast content fingerprint, not a cryptographic hash;
+# use SIMD blake3 when installed
+try:
+    from blake3 import blake3 as _fast_hash
+except ImportError:
+    _fast_hash = hashlib.sha256
 
 logger = structlog.get_logger(__name__)
 
 
+def _default_file_mode() -> int:
+    """Mode open() gives new files under this process's umask"""
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+# Read once at import: os.umask can only be queried by setting it
+_MODEL_FILE_MODE = _default_file_mode()
+
+# Feature extraction patterns, compiled once at import
+_PHONE_RE = re.compile(r'\b\d{3}[-.]?\d{3}[-.]?\d{4}\b')
+_DATE_RE = re.compile(r'\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b')
+_TIME_RE = re.compile(r'\b\d{1,2}:\d{2}(:\d{2})?\b')
+_NUM_RE = re.compile(r'\b\d+\.?\d*\b')
+
+# Column value patterns used to infer date/time columns, fused into one alternation
+_DATE_OR_TIME_RE = re.compile(
+    r'\d{1,2}[/-]\d{1,2}[/-]\d{2,4}'
+    r'|\d{4}-\d{2}-\d{2}'
+    r'|\d{1,2}:\d{2}(?::\d{2})?'
+)
+
+
+# Leading lines kept for header/delimiter/structure analysis
+_HEAD_LINES = 100
+
+# Only this much of a file is decoded and scanned; every feature works off a
+# prefix, so multi-MB uploads are never materialized as one Python str
+_CONTENT_PREFIX_CHARS = 64 * 1024
+
+
+@dataclass
+class _FileContext:
+    """File content split once and shared across the feature extractors"""
+    content: str
+    head_lines: List[str]
+    line_count: int
+    
+    @classmethod
+    def from_content(cls, content: Union[str, bytes]) -> '_FileContext':
+        # Line count comes from the full input; everything else from the prefix
+        if isinstance(content, bytes):
+            line_count = content.count(b'\n') + 1
+            content = content[:_CONTENT_PREFIX_CHARS].decode('utf-8', errors='ignore')
+        else:
+            line_count = content.count('\n') + 1
+            content = content[:_CONTENT_PREFIX_CHARS]
+        
+        return cls(
+            content=content,
+            head_lines=content.split('\n', _HEAD_LINES)[:_HEAD_LINES],
+            line_count=line_count
+        )
+
+
+@lru_cache(maxsize=4096)
+def _field_signature(field_name: str) -> Tuple[str, FrozenSet[str]]:
+    """Normalized field name and its character set, cached across calls"""
+    normalized = field_name.lower().replace(' ', '').replace('_', '').replace('-', '')
+    return normalized, frozenset(normalized)
+
+
+def _signature_similarity(
+    sig1: Tuple[str, FrozenSet[str]],
+    sig2: Tuple[str, FrozenSet[str]],
+    min_score: float = 0.0
+) -> float:
+    """Similarity of two field signatures (see _field_signature).
+    
+    Returns 0.0 early when the character-overlap score cannot exceed
+    min_score: Jaccard over character sets is bounded by the ratio of their sizes.
+    """
+    field1, chars1 = sig1
+    field2, chars2 = sig2
+    
+    if field1 == field2:
+        return 1.0
+    
+    # Check if one contains the other
+    if field1 in field2 or field2 in field1:
+        return 0.8
+    
+    # Simple character overlap
+    size1, size2 = len(chars1), len(chars2)
+    if not size1 or not size2:
+        return 0.0
+    if min(size1, size2) / max(size1, size2) <= min_score:
+        return 0.0
+    
+    return len(chars1 & chars2) / len(chars1 | chars2)
+
+
 class LayoutClassifier:
     """ML-powered document layout classifier for carrier files"""
     
     def __init__(self):
         self.models = {}
         self.vectorizers = {}
+        # LRU of class probabilities keyed by (model, model version, text digest);
+        # recurring carrier statement templates hit this instead of the ensemble
+        self._prediction_cache: OrderedDict = OrderedDict()
+        self._prediction_cache_size = 1024
+        self._model_version = 0
+        # Full classify_layout results keyed by (model version, content
+        # digest, line count, filename), for re-uploads and retried jobs
+        self._classification_cache: OrderedDict = OrderedDict()
+        self._classification_cache_size = 256
         self.carrier_patterns = self._load_carrier_patterns()
+        self._keyword_automaton = self._build_keyword_automaton()
         self.field_mappings = self._load_field_mappings()
+        
+        # Pre-normalize carrier template fields so matching only pays for candidates
+        for carrier_mappings in self.field_mappings.values():
+            for source_field in carrier_mappings:
+                _field_signature(source_field)
+        
         self._ensure_models_loaded()
     
     def _load_carrier_patterns(self) -> Dict[str, Dict[str, Any]]:
@@ -109,6 +243,27 @@ class LayoutClassifier:
             }
         }
     
+    def _build_keyword_automaton(self):
+        """Build one Aho-Corasick automaton over all carrier keywords"""
+        try:
+            import ahocorasick
+        except ImportError:
+            # Fall back to per-keyword scans in _count_carrier_keywords
+            return None
+        
+        # Some keywords (e.g. "wireless") belong to several carriers
+        keyword_carriers: Dict[str, List[str]] = {}
+        for carrier, patterns in self.carrier_patterns.items():
+            for keyword in patterns["keywords"]:
+                keyword_carriers.setdefault(keyword.lower(), []).append(carrier)
+        
+        automaton = ahocorasick.Automaton()
+        for keyword, carriers in keyword_carriers.items():
+            automaton.add_word(keyword, tuple(carriers))
+        automaton.make_automaton()
+        
+        return automaton
+    
     def _load_field_mappings(self) -> Dict[str, Dict[str, str]]:
         """Load standard field mappings for each carrier"""
         return {
@@ -165,15 +320,28 @@ class LayoutClassifier:
         for model_name, filename in model_files.items():
             model_path = Path(settings.model_cache_dir) / filename
             
+            # The field mapper is fitted offline (python -m
+            # phonelogai_workers.ml.train_field_mapper); workers only load it,
+            # memory-mapping its arrays so processes share the pages
+            offline_only = (
+                model_name == "field_mapper" and not settings.train_field_mapper_on_startup
+            )
+            mmap_mode = 'r' if model_name == "field_mapper" else None
+            
             if model_path.exists():
                 try:
-                    self.models[model_name] = joblib.load(model_path)
+                    self.models[model_name] = joblib.load(model_path, mmap_mode=mmap_mode)
                     logger.info(f"Loaded model: {model_name}")
+                    continue
                 except Exception as e:
-                    logger.warning(f"Failed to load {model_name}, will retrain", error=str(e))
-                    self._train_model(model_name)
+                    logger.warning(f"Failed to load {model_name}", error=str(e))
             else:
-                logger.info(f"Model {model_name} not found, training...")
+                logger.info(f"Model {model_name} not found")
+            
+            if offline_only:
+                self._create_fallback_model(model_name)
+            else:
+                logger.info(f"Training {model_name}...")
                 self._train_model(model_name)
     
     def _train_model(self, model_name: str):
@@ -258,20 +426,21 @@ class LayoutClassifier:
         ]
         
         for samples, label in sample_sets:
-            for sample in samples:
-                training_data.append(sample)
-                labels.append(label)
-                
-                # Add variations with noise and formatting differences
-                noisy_sample = sample.lower()
-                training_data.append(noisy_sample)
-                labels.append(label)
-                
-                # Add partial samples
-                if len(sample) > 50:
-                    partial_sample = sample[:len(sample)//2]
-                    training_data.append(partial_sample)
-                    labels.append(label)
+            originals = pd.Series(samples, dtype='string')
+            
+            # Add variations with noise and formatting differences
+            lowered = originals.str.lower()
+            
+            # Add partial samples
+            long_samples = originals[originals.str.len() > 50]
+            partials = pd.Series(
+                [sample[:len(sample) // 2] for sample in long_samples],
+                dtype='string'
+            )
+            
+            augmented = pd.concat([originals, lowered, partials], ignore_index=True).tolist()
+            training_data.extend(augmented)
+            labels.extend([label] * len(augmented))
         
         # Create ensemble classifier for better accuracy
         base_classifiers = [
@@ -287,9 +456,10 @@ class LayoutClassifier:
                 max_depth=8,
                 random_state=42
             )),
-            ('svc', SVC(
-                kernel='linear',
-                probability=True,
+            # Linear model over sparse TF-IDF; SVC(probability=True) ran an
+            # internal 5-fold Platt calibration on every fit
+            ('lr', LogisticRegression(
+                max_iter=1000,
                 random_state=42,
                 class_weight='balanced'
             ))
@@ -324,9 +494,7 @@ class LayoutClassifier:
         ])
         
         # Save model
-        model_path = Path(settings.model_cache_dir) / "format_classifier.joblib"
-        joblib.dump(pipeline, model_path)
-        self.models["format_classifier"] = pipeline
+        self._save_model("format_classifier", pipeline)
         
         # Enhanced evaluation with multiple metrics
         scores = cross_val_score(pipeline, training_data, labels, cv=5, scoring='accuracy')
@@ -518,7 +686,8 @@ class LayoutClassifier:
                 max_depth=12,
                 random_state=42,
                 class_weight='balanced',
-                min_samples_split=3
+                min_samples_split=3,
+                n_jobs=1
             )),
             ('lr', LogisticRegression(
                 random_state=42,
@@ -528,14 +697,14 @@ class LayoutClassifier:
         ]
         
         # Train ensemble with hyperparameter tuning
-        from sklearn.feature_extraction.text import FeatureUnion
-        
         feature_union = FeatureUnion(feature_extractors)
         
+        # Grid search is the only parallel layer; nesting n_jobs=-1 in the
+        # ensemble and forest as well oversubscribes cores with n_cores^3 threads
         ensemble = VotingClassifier(
             estimators=base_classifiers,
             voting='soft',
-            n_jobs=-1
+            n_jobs=1
         )
         
         # Create final pipeline
@@ -559,13 +728,12 @@ class LayoutClassifier:
             verbose=1
         )
         
-        grid_search.fit(training_data, labels)
+        with joblib.parallel_backend('loky', n_jobs=os.cpu_count()):
+            grid_search.fit(training_data, labels)
         best_pipeline = grid_search.best_estimator_
         
         # Save optimized model
-        model_path = Path(settings.model_cache_dir) / "carrier_classifier.joblib"
-        joblib.dump(best_pipeline, model_path)
-        self.models["carrier_classifier"] = best_pipeline
+        self._save_model("carrier_classifier", best_pipeline)
         
         # Comprehensive evaluation
         scores = cross_val_score(best_pipeline, training_data, labels, cv=5, scoring='accuracy')
@@ -582,9 +750,11 @@ class LayoutClassifier:
     
     def _train_field_mapper(self):
         """Train enhanced field mapping classifier with intelligent pattern recognition"""
-        training_data = []
-        labels = []
-        
+        training_data, labels = self._build_field_mapper_training_data()
+        self._fit_and_save_field_mapper(training_data, labels)
+    
+    def _build_field_mapper_training_data(self) -> Tuple[List[str], List[str]]:
+        """Build (header text, target field) training samples for the field mapper"""
         # Comprehensive field mappings with carrier-specific variations
         enhanced_field_mappings = {
             "ts": [
@@ -678,148 +848,180 @@ class LayoutClassifier:
             ]
         }
         
-        # Generate comprehensive training data with context
-        for target_field, variations in enhanced_field_mappings.items():
-            for variation in variations:
-                # Base field name
-                training_data.append(variation.lower())
-                labels.append(target_field)
-                
-                # Add variations with common prefixes/suffixes
-                prefixes = ["", "call_", "sms_", "usage_", "billing_", "customer_", "account_"]
-                suffixes = ["", "_id", "_code", "_value", "_data", "_info", "_field"]
-                
-                for prefix in prefixes[:3]:  # Limit to avoid explosion
-                    for suffix in suffixes[:3]:
-                        if prefix or suffix:  # Don't duplicate base case
-                            variant = f"{prefix}{variation}{suffix}".lower()
-                            training_data.append(variant)
-                            labels.append(target_field)
-                
-                # Add common formatting variations
-                formatted_variations = [
-                    variation.replace("_", " "),
-                    variation.replace(" ", "_"),
-                    variation.replace("-", "_"),
-                    variation.replace("_", "-"),
-                    variation.upper(),
-                    variation.title(),
-                ]
-                
-                for formatted in formatted_variations:
-                    training_data.append(formatted.lower())
-                    labels.append(target_field)
+        # Base field name plus variations with common prefixes/suffixes
+        # (limited to avoid explosion); ("", "") is the base case
+        affixes = [
+            (prefix, suffix)
+            for prefix in ("", "call_", "sms_")
+            for suffix in ("", "_id", "_code")
+        ]
         
-        # Create advanced feature extraction pipeline
-        feature_union = FeatureUnion([
-            ('char_tfidf', TfidfVectorizer(
+        # Common formatting variations (upper/title casing is a no-op once lowercased)
+        formatters = (
+            lambda v: v.replace("_", " "),
+            lambda v: v.replace(" ", "_"),
+            lambda v: v.replace("-", "_"),
+            lambda v: v.replace("_", "-"),
+        )
+        
+        # Generate comprehensive training data with context in one pass,
+        # dropping exact (text, label) duplicates while preserving order
+        samples = dict.fromkeys(
+            (text.lower(), target_field)
+            for target_field, variations in enhanced_field_mappings.items()
+            for variation in variations
+            for text in (
+                [f"{prefix}{variation}{suffix}" for prefix, suffix in affixes]
+                + [formatter(variation) for formatter in formatters]
+            )
+        )
+        training_data = [text for text, _ in samples]
+        labels = [label for _, label in samples]
+        
+        return training_data, labels
+    
+    def _fit_and_save_field_mapper(self, training_data: List[str], labels: List[str]):
+        """Fit the field mapper pipeline on training samples and persist it"""
+        # Character n-grams carry almost all of the signal in short header
+        # names; the word and raw char-count views mostly duplicated them.
+        # Hashing vectorizers are stateless (no vocabulary dict to build,
+        # store or look up per token); alternate_sign=False keeps features
+        # non-negative for ComplementNB, norm=None hands raw counts to the
+        # sublinear TF-IDF step, and float32 output halves the size of the
+        # sparse matrices.
+        char_features = make_pipeline(
+            HashingVectorizer(
                 analyzer='char_wb',
                 ngram_range=(2, 6),
-                max_features=800,
-                sublinear_tf=True
-            )),
-            ('word_tfidf', TfidfVectorizer(
-                analyzer='word',
-                ngram_range=(1, 2),
-                max_features=500,
-                sublinear_tf=True
-            )),
-            ('count_vec', CountVectorizer(
-                analyzer='char',
-                ngram_range=(2, 4),
-                max_features=300
-            ))
-        ])
+                n_features=2**13,
+                alternate_sign=False,
+                norm=None,
+                dtype=np.float32
+            ),
+            TfidfTransformer(sublinear_tf=True)
+        )
         
-        # Create ensemble classifier
+        # Two linear models consuming the sparse features directly; a random
+        # forest here densified the whole matrix and dominated model size.
+        # ComplementNB is fitted in closed form and copes with the uneven
+        # class sizes of the training vocabulary without reweighting.
         base_classifiers = [
-            ('nb', MultinomialNB(alpha=0.05)),
+            ('nb', ComplementNB(alpha=0.05, norm=True)),
             ('lr', LogisticRegression(
+                C=1.0,
                 random_state=42,
                 class_weight='balanced',
                 max_iter=2000
-            )),
-            ('rf', RandomForestClassifier(
-                n_estimators=100,
-                max_depth=10,
-                random_state=42,
-                class_weight='balanced'
             ))
         ]
         
+        # Soft voting does little work per estimator; give the cores to the
+        # (bounded) search instead of oversubscribing
         ensemble = VotingClassifier(
             estimators=base_classifiers,
             voting='soft',
-            n_jobs=-1
+            n_jobs=1
         )
         
         # Create optimized pipeline
         pipeline = Pipeline([
-            ('features', feature_union),
-            ('scaler', StandardScaler(with_mean=False)),  # For sparse matrices
+            ('features', char_features),
+            ('scaler', StandardScaler(with_mean=False, copy=False)),  # For sparse matrices
             ('classifier', ensemble)
         ])
         
-        # Train with hyperparameter optimization
-        param_grid = {
-            'classifier__nb__alpha': [0.01, 0.05, 0.1],
-            'classifier__lr__C': [0.1, 1.0, 10.0],
+        # Train with hyperparameter optimization over a fixed sampling budget
+        param_distributions = {
+            'classifier__nb__alpha': loguniform(1e-3, 1),
+            'classifier__lr__C': loguniform(0.01, 100),
         }
         
-        grid_search = GridSearchCV(
+        search = RandomizedSearchCV(
             pipeline,
-            param_grid,
-            cv=5,
+            param_distributions,
+            n_iter=5,
+            cv=3,
             scoring='accuracy',
-            n_jobs=-1
+            n_jobs=3,  # one worker per fold
+            random_state=42
         )
         
-        grid_search.fit(training_data, labels)
-        best_pipeline = grid_search.best_estimator_
+        with joblib.parallel_backend('loky', n_jobs=os.cpu_count()):
+            search.fit(training_data, labels)
+        best_pipeline = search.best_estimator_
         
         # Save optimized model
-        model_path = Path(settings.model_cache_dir) / "field_mapper.joblib"
-        joblib.dump(best_pipeline, model_path)
-        self.models["field_mapper"] = best_pipeline
+        self._save_model("field_mapper", best_pipeline)
         
-        # Comprehensive evaluation
-        scores = cross_val_score(best_pipeline, training_data, labels, cv=5, scoring='accuracy')
-        precision_scores = cross_val_score(best_pipeline, training_data, labels, cv=5, scoring='precision_macro')
-        recall_scores = cross_val_score(best_pipeline, training_data, labels, cv=5, scoring='recall_macro')
+        # Comprehensive evaluation (one set of 5-fold fits for all metrics)
+        cv_results = cross_validate(
+            best_pipeline, training_data, labels, cv=5,
+            scoring=['accuracy', 'precision_macro', 'recall_macro']
+        )
+        scores = cv_results['test_accuracy']
         
         logger.info(
             f"Enhanced field mapper performance:"
             f" Accuracy: {scores.mean():.3f} (+/- {scores.std() * 2:.3f})"
-            f" Precision: {precision_scores.mean():.3f}"
-            f" Recall: {recall_scores.mean():.3f}"
-            f" Best params: {grid_search.best_params_}"
+            f" Precision: {cv_results['test_precision_macro'].mean():.3f}"
+            f" Recall: {cv_results['test_recall_macro'].mean():.3f}"
+            f" Best params: {search.best_params_}"
         )
     
+    def _save_model(self, model_name: str, pipeline: Any):
+        """Persist a trained model to the cache and register it"""
+        model_path = Path(settings.model_cache_dir) / f"{model_name}.joblib"
+        
+        # Stream the pickle through a large write buffer straight to disk and
+        # swap it in atomically so concurrent workers never load a partial file;
+        # each writer gets its own temp file so trainers can't interleave
+        tmp_file = tempfile.NamedTemporaryFile(
+            dir=model_path.parent,
+            prefix=f"{model_name}.",
+            suffix=".joblib.tmp",
+            delete=False,
+            buffering=1 << 20
+        )
+        try:
+            with tmp_file as f:
+                joblib.dump(pipeline, f, protocol=pickle.HIGHEST_PROTOCOL)
+            # Temp files are created 0600; give the model the mode a plain
+            # open() would, so workers running as another user can load it
+            os.chmod(tmp_file.name, _MODEL_FILE_MODE)
+            os.replace(tmp_file.name, model_path)
+        except BaseException:
+            Path(tmp_file.name).unlink(missing_ok=True)
+            raise
+        
+        self.models[model_name] = pipeline
+        self._model_version += 1
+    
     def _create_fallback_model(self, model_name: str):
         """Create rule-based fallback model if ML training fails"""
         class RuleBasedClassifier:
             def __init__(self, classifier_type: str):
                 self.type = classifier_type
+                # Constant outputs are built once; per-call results are views
+                if classifier_type == "format":
+                    self._row = np.array([0.33, 0.33, 0.34], dtype=np.float32)  # pdf, csv, txt
+                    self._label = "csv"
+                elif classifier_type == "carrier":
+                    self._row = np.full(5, 0.2, dtype=np.float32)  # att, verizon, tmobile, sprint, unknown
+                    self._label = "unknown"
+                else:
+                    self._row = np.full(10, 0.1, dtype=np.float32)  # field mapping
+                    self._label = "unknown"
             
             def predict_proba(self, X):
-                # Return uniform probabilities as fallback
+                # Return uniform probabilities as fallback (read-only view)
                 n_samples = len(X) if hasattr(X, '__len__') else 1
-                if self.type == "format":
-                    return np.array([[0.33, 0.33, 0.34]] * n_samples)  # pdf, csv, txt
-                elif self.type == "carrier": 
-                    return np.array([[0.2, 0.2, 0.2, 0.2, 0.2]] * n_samples)  # att, verizon, tmobile, sprint, unknown
-                else:
-                    return np.array([[0.1] * 10] * n_samples)  # field mapping
+                return np.broadcast_to(self._row, (n_samples, self._row.size))
             
             def predict(self, X):
-                if self.type == "format":
-                    return ["csv"] * len(X)
-                elif self.type == "carrier":
-                    return ["unknown"] * len(X) 
-                else:
-                    return ["unknown"] * len(X)
+                return np.full(len(X), self._label, dtype=object)
         
         self.models[model_name] = RuleBasedClassifier(model_name.split('_')[0])
+        self._model_version += 1
         logger.warning(f"Using rule-based fallback for {model_name}")
     
     async def classify_layout(
@@ -840,57 +1042,19 @@ class LayoutClassifier:
             Dict containing classification results
         """
         try:
-            # Convert bytes to string if needed
-            if isinstance(file_content, bytes):
-                try:
-                    file_content = file_content.decode('utf-8', errors='ignore')
-                except:
-                    file_content = str(file_content, errors='ignore')
-            
-            # Extract features for classification
-            features = self._extract_features(file_content, filename)
-            
-            # Classify file format
-            format_result = self._classify_format(features)
-            
-            # Classify carrier
-            carrier_result = self._classify_carrier(features)
-            
-            # Generate field mappings
-            field_mappings = self._generate_field_mappings(features, carrier_result["carrier"])
-            
-            # Detect table structure
-            table_structure = self._detect_table_structure(file_content, format_result["format"])
-            
-            # Calculate overall confidence
-            overall_confidence = (
-                format_result["confidence"] * 0.3 + 
-                carrier_result["confidence"] * 0.4 +
-                field_mappings["confidence"] * 0.3
-            )
+            # Decode (bytes) and split a bounded prefix once, and share the
+            # lines across all feature extractors
+            ctx = _FileContext.from_content(file_content)
             
-            # Determine if manual mapping is required
-            requires_manual_mapping = (
-                overall_confidence < 0.75 or 
-                carrier_result["carrier"] == "unknown" or
-                len(field_mappings["mappings"]) < 3
-            )
-            
-            classification_result = {
-                "detected_format": format_result["format"],
-                "carrier": carrier_result["carrier"],
-                "confidence": overall_confidence,
-                "field_mappings": field_mappings["mappings"],
-                "table_structure": table_structure,
-                "requires_manual_mapping": requires_manual_mapping,
-                "analysis_details": {
-                    "format_confidence": format_result["confidence"],
-                    "carrier_confidence": carrier_result["confidence"],
-                    "mapping_confidence": field_mappings["confidence"],
-                    "detected_fields": len(field_mappings["mappings"]),
-                    "file_characteristics": features
-                }
-            }
+            # Re-uploads and retries of the same file hit the memoized result
+            cache_key = self._classification_cache_key(ctx, filename)
+            cached = self._classification_cache.get(cache_key)
+            if cached is not None:
+                self._classification_cache.move_to_end(cache_key)
+                classification_result = copy.deepcopy(cached)
+            else:
+                classification_result = self._classify_context(ctx, filename)
+                self._cache_classification(cache_key, classification_result)
             
             # Save to database if job_id provided
             if job_id:
@@ -907,42 +1071,191 @@ class LayoutClassifier:
             logger.info(
                 "Layout classification completed",
                 job_id=job_id,
-                format=format_result["format"],
-                carrier=carrier_result["carrier"],
-                confidence=overall_confidence,
-                requires_manual_mapping=requires_manual_mapping
+                format=classification_result["detected_format"],
+                carrier=classification_result["carrier"],
+                confidence=classification_result["confidence"],
+                requires_manual_mapping=classification_result["requires_manual_mapping"]
             )
             
             return classification_result
             
         except Exception as e:
             logger.error("Layout classification failed", job_id=job_id, error=str(e))
+            return self._fallback_classification(e)
+    
+    async def classify_layout_batch(
+        self,
+        contents: List[Union[str, bytes]],
+        filenames: List[str]
+    ) -> List[Dict[str, Any]]:
+        """
+        Classify several documents, scoring each model once for the whole batch
+        
+        Args:
+            contents: Raw file contents
+            filenames: Original filename for each entry of contents
             
-            # Return fallback classification
-            return {
-                "detected_format": "csv",  # Most common format
-                "carrier": "unknown",
-                "confidence": 0.1,  # Very low confidence
-                "field_mappings": [],
-                "table_structure": None,
-                "requires_manual_mapping": True,
-                "error": str(e)
+        Returns:
+            Classification results in input order, as classify_layout returns them
+        """
+        if len(contents) != len(filenames):
+            raise ValueError("contents and filenames must have the same length")
+        
+        results: List[Optional[Dict[str, Any]]] = [None] * len(contents)
+        pending = []
+        
+        for index, (file_content, filename) in enumerate(zip(contents, filenames)):
+            try:
+                ctx = _FileContext.from_content(file_content)
+                cache_key = self._classification_cache_key(ctx, filename)
+                cached = self._classification_cache.get(cache_key)
+                if cached is not None:
+                    self._classification_cache.move_to_end(cache_key)
+                    results[index] = copy.deepcopy(cached)
+                else:
+                    pending.append((index, ctx, cache_key, self._extract_features(ctx, filename)))
+            except Exception as e:
+                logger.error("Layout classification failed", filename=filename, error=str(e))
+                results[index] = self._fallback_classification(e)
+        
+        if pending:
+            # One predict_proba call per model warms the prediction cache, so
+            # the per-document pipeline below only reads it back
+            features_list = [features for _, _, _, features in pending]
+            for model_name, feature_text in (
+                ("format_classifier", self._format_feature_text),
+                ("carrier_classifier", self._carrier_feature_text)
+            ):
+                model = self.models.get(model_name)
+                if not model:
+                    continue
+                try:
+                    self._predict_proba_batch(
+                        model_name, model, [feature_text(features) for features in features_list]
+                    )
+                except Exception as e:
+                    logger.warning("Batched prediction failed", model=model_name, error=str(e))
+            
+            for index, ctx, cache_key, features in pending:
+                try:
+                    classification_result = self._classify_context(ctx, filenames[index], features)
+                    self._cache_classification(cache_key, classification_result)
+                    results[index] = classification_result
+                except Exception as e:
+                    logger.error("Layout classification failed", filename=filenames[index], error=str(e))
+                    results[index] = self._fallback_classification(e)
+        
+        logger.info(
+            "Batch layout classification completed",
+            documents=len(results),
+            classified=len(pending)
+        )
+        
+        return results
+    
+    def _classification_cache_key(self, ctx: _FileContext, filename: str) -> Tuple:
+        """Key for memoized classifications of the same content and filename"""
+        return (
+            self._model_version,
+            _fast_hash(ctx.content.encode('utf-8', errors='ignore')).digest()[:16],
+            ctx.line_count,
+            filename.lower()
+        )
+    
+    def _cache_classification(self, cache_key: Tuple, classification_result: Dict[str, Any]):
+        """Store a classification result, evicting the least recently used"""
+        self._classification_cache[cache_key] = copy.deepcopy(classification_result)
+        if len(self._classification_cache) > self._classification_cache_size:
+            self._classification_cache.popitem(last=False)
+    
+    def _fallback_classification(self, error: Exception) -> Dict[str, Any]:
+        """Low-confidence classification returned when the pipeline fails"""
+        return {
+            "detected_format": "csv",  # Most common format
+            "carrier": "unknown",
+            "confidence": 0.1,  # Very low confidence
+            "field_mappings": [],
+            "table_structure": None,
+            "requires_manual_mapping": True,
+            "error": str(error)
+        }
+    
+    def _classify_context(
+        self,
+        ctx: _FileContext,
+        filename: str,
+        features: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Run the classification pipeline over prepared file content"""
+        # Extract features for classification
+        if features is None:
+            features = self._extract_features(ctx, filename)
+        
+        # Classify file format
+        format_result = self._classify_format(features)
+        
+        # Classify carrier
+        carrier_result = self._classify_carrier(features)
+        
+        # Generate field mappings
+        field_mappings = self._generate_field_mappings(features, carrier_result["carrier"])
+        
+        # Detect table structure
+        table_structure = self._detect_table_structure(ctx, format_result["format"])
+        
+        # Calculate overall confidence
+        overall_confidence = (
+            format_result["confidence"] * 0.3 + 
+            carrier_result["confidence"] * 0.4 +
+            field_mappings["confidence"] * 0.3
+        )
+        
+        # Determine if manual mapping is required
+        requires_manual_mapping = (
+            overall_confidence < 0.75 or 
+            carrier_result["carrier"] == "unknown" or
+            len(field_mappings["mappings"]) < 3
+        )
+        
+        classification_result = {
+            "detected_format": format_result["format"],
+            "carrier": carrier_result["carrier"],
+            "confidence": overall_confidence,
+            "field_mappings": field_mappings["mappings"],
+            "table_structure": table_structure,
+            "requires_manual_mapping": requires_manual_mapping,
+            "analysis_details": {
+                "format_confidence": format_result["confidence"],
+                "carrier_confidence": carrier_result["confidence"],
+                "mapping_confidence": field_mappings["confidence"],
+                "detected_fields": len(field_mappings["mappings"]),
+                "file_characteristics": features
             }
+        }
+        
+        return classification_result
     
-    def _extract_features(self, content: str, filename: str) -> Dict[str, Any]:
+    def _extract_features(self, ctx: _FileContext, filename: str) -> Dict[str, Any]:
         """Extract features from file content for ML classification"""
+        content = ctx.content
+        line_lengths = np.fromiter(
+            (len(line) for line in ctx.head_lines),
+            dtype=np.int32,
+            count=len(ctx.head_lines)
+        )
+        
         features = {
             "filename": filename.lower(),
             "content_sample": content[:2000],  # First 2KB for analysis
-            "line_count": len(content.split('\n')),
-            "avg_line_length": np.mean([len(line) for line in content.split('\n')[:100]]),
-            "has_headers": self._detect_headers(content),
-            "delimiter_candidates": self._detect_delimiters(content),
-            "phone_patterns": len(re.findall(r'\b\d{3}[-.]?\d{3}[-.]?\d{4}\b', content)),
-            "date_patterns": len(re.findall(r'\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b', content)),
-            "time_patterns": len(re.findall(r'\b\d{1,2}:\d{2}(:\d{2})?\b', content)),
+            "line_count": ctx.line_count,
+            "avg_line_length": float(line_lengths.mean()),
+            "has_headers": self._detect_headers(ctx.head_lines),
+            "delimiter_candidates": self._detect_delimiters(ctx.head_lines),
+            "phone_patterns": len(_PHONE_RE.findall(content)),
+            "date_patterns": len(_DATE_RE.findall(content)),
+            "time_patterns": len(_TIME_RE.findall(content)),
             "carrier_keywords": self._count_carrier_keywords(content),
-            "numeric_fields": len(re.findall(r'\b\d+\.?\d*\b', content)),
+            "numeric_fields": len(_NUM_RE.findall(content)),
         }
         
         return features
@@ -954,19 +1267,12 @@ class LayoutClassifier:
             if not model:
                 return {"format": "csv", "confidence": 0.1}
             
-            # Prepare feature text for classification
-            feature_text = f"""
-            filename: {features['filename']}
-            content: {features['content_sample']}
-            lines: {features['line_count']}
-            delimiters: {features['delimiter_candidates']}
-            phone_patterns: {features['phone_patterns']}
-            """
-            
-            # Get prediction probabilities
-            proba = model.predict_proba([feature_text])[0]
-            prediction = model.predict([feature_text])[0]
-            confidence = float(np.max(proba))
+            # Get prediction probabilities; predict() is just their argmax
+            feature_text = self._format_feature_text(features)
+            proba = self._cached_predict_proba("format_classifier", model, feature_text)
+            best_idx = int(np.argmax(proba))
+            prediction = model.classes_[best_idx]
+            confidence = float(proba[best_idx])
             
             return {
                 "format": prediction,
@@ -985,17 +1291,12 @@ class LayoutClassifier:
             if not model:
                 return {"carrier": "unknown", "confidence": 0.1}
             
-            # Prepare feature text for classification
-            feature_text = f"""
-            filename: {features['filename']}
-            content: {features['content_sample']}
-            carrier_keywords: {features['carrier_keywords']}
-            """
-            
-            # Get prediction probabilities  
-            proba = model.predict_proba([feature_text])[0]
-            prediction = model.predict([feature_text])[0]
-            confidence = float(np.max(proba))
+            # Get prediction probabilities; predict() is just their argmax
+            feature_text = self._carrier_feature_text(features)
+            proba = self._cached_predict_proba("carrier_classifier", model, feature_text)
+            best_idx = int(np.argmax(proba))
+            prediction = model.classes_[best_idx]
+            confidence = float(proba[best_idx])
             
             return {
                 "carrier": prediction,
@@ -1007,6 +1308,60 @@ class LayoutClassifier:
             logger.error("Carrier classification failed", error=str(e))
             return {"carrier": "unknown", "confidence": 0.1}
     
+    def _format_feature_text(self, features: Dict[str, Any]) -> str:
+        """Feature text for the format classifier"""
+        # No indentation, which would otherwise become whitespace n-grams
+        return (
+            f"filename: {features['filename']}\n"
+            f"content: {features['content_sample']}\n"
+            f"lines: {features['line_count']}\n"
+            f"delimiters: {features['delimiter_candidates']}\n"
+            f"phone_patterns: {features['phone_patterns']}"
+        )
+    
+    def _carrier_feature_text(self, features: Dict[str, Any]) -> str:
+        """Feature text for the carrier classifier"""
+        return (
+            f"filename: {features['filename']}\n"
+            f"content: {features['content_sample']}\n"
+            f"carrier_keywords: {features['carrier_keywords']}"
+        )
+    
+    def _cached_predict_proba(self, model_name: str, model: Any, feature_text: str) -> np.ndarray:
+        """Predict class probabilities, memoized on a digest of the feature text"""
+        return self._predict_proba_batch(model_name, model, [feature_text])[0]
+    
+    def _predict_proba_batch(self, model_name: str, model: Any, feature_texts: List[str]) -> List[np.ndarray]:
+        """Memoized class probabilities for several texts, with one model call for the misses"""
+        keys = [
+            (
+                model_name,
+                self._model_version,
+                _fast_hash(feature_text.encode('utf-8', errors='ignore')).digest()[:16]
+            )
+            for feature_text in feature_texts
+        ]
+        
+        probas = [self._prediction_cache.get(key) for key in keys]
+        misses = {}
+        for index, (key, proba) in enumerate(zip(keys, probas)):
+            if proba is None:
+                # Duplicate texts in the batch are scored once
+                misses.setdefault(key, []).append(index)
+            else:
+                self._prediction_cache.move_to_end(key)
+        
+        if misses:
+            first_texts = [feature_texts[indices[0]] for indices in misses.values()]
+            for (key, indices), proba in zip(misses.items(), model.predict_proba(first_texts)):
+                for index in indices:
+                    probas[index] = proba
+                self._prediction_cache[key] = proba
+                if len(self._prediction_cache) > self._prediction_cache_size:
+                    self._prediction_cache.popitem(last=False)
+        
+        return probas
+    
     def _generate_field_mappings(self, features: Dict[str, Any], carrier: str) -> Dict[str, Any]:
         """Generate field mappings using ML model and carrier templates"""
         try:
@@ -1019,45 +1374,69 @@ class LayoutClassifier:
             # Use carrier-specific mappings if available
             if carrier in self.field_mappings:
                 carrier_mappings = self.field_mappings[carrier]
+                # Normalize each candidate once rather than per template field
+                candidate_signatures = [
+                    (candidate, _field_signature(candidate)) for candidate in field_candidates
+                ]
                 for source_field, target_field in carrier_mappings.items():
-                    # Check if source field exists in candidates
-                    matching_candidates = [
-                        candidate for candidate in field_candidates 
-                        if self._field_similarity(source_field, candidate) > 0.7
-                    ]
+                    source_signature = _field_signature(source_field)
                     
-                    if matching_candidates:
-                        best_match = max(matching_candidates, key=lambda x: self._field_similarity(source_field, x))
+                    # Score each candidate once and keep the best match above threshold
+                    scored = (
+                        (candidate, _signature_similarity(source_signature, signature, 0.7))
+                        for candidate, signature in candidate_signatures
+                    )
+                    best = max(
+                        (match for match in scored if match[1] > 0.7),
+                        key=lambda match: match[1],
+                        default=None
+                    )
+                    
+                    if best is not None:
+                        best_match, similarity = best
                         mappings.append({
                             "source_field": best_match,
                             "target_field": target_field,
                             "data_type": self._infer_data_type(target_field),
-                            "confidence": self._field_similarity(source_field, best_match),
+                            "confidence": similarity,
                             "is_required": target_field in ["ts", "number", "type", "direction"]
                         })
-                        confidence_scores.append(self._field_similarity(source_field, best_match))
+                        confidence_scores.append(similarity)
             
             # Use ML model for additional mappings
             model = self.models.get("field_mapper")
             if model and field_candidates:
-                for candidate in field_candidates:
-                    if not any(m["source_field"] == candidate for m in mappings):
-                        try:
-                            prediction = model.predict([candidate.lower()])[0]
-                            proba = model.predict_proba([candidate.lower()])[0]
-                            confidence = float(np.max(proba))
-                            
-                            if confidence > 0.5:  # Only include high-confidence predictions
-                                mappings.append({
-                                    "source_field": candidate,
-                                    "target_field": prediction,
-                                    "data_type": self._infer_data_type(prediction),
-                                    "confidence": confidence,
-                                    "is_required": prediction in ["ts", "number", "type", "direction"]
-                                })
-                                confidence_scores.append(confidence)
-                        except:
-                            continue
+                mapped_fields = {m["source_field"] for m in mappings}
+                remaining = [
+                    candidate for candidate in field_candidates
+                    if candidate not in mapped_fields
+                ]
+                
+                if remaining:
+                    # One batched transform + predict_proba for all candidates
+                    try:
+                        probas = model.predict_proba([candidate.lower() for candidate in remaining])
+                    except Exception as e:
+                        logger.warning("Field mapper prediction failed", error=str(e))
+                        probas = None
+                    
+                    if probas is not None:
+                        best_indices = probas.argmax(axis=1)
+                        confidences = probas[np.arange(len(remaining)), best_indices]
+                        
+                        # Only include high-confidence predictions
+                        for i in np.flatnonzero(confidences > 0.5):
+                            candidate = remaining[i]
+                            prediction = model.classes_[best_indices[i]]
+                            confidence = float(confidences[i])
+                            mappings.append({
+                                "source_field": candidate,
+                                "target_field": prediction,
+                                "data_type": self._infer_data_type(prediction),
+                                "confidence": confidence,
+                                "is_required": prediction in ["ts", "number", "type", "direction"]
+                            })
+                            confidence_scores.append(confidence)
             
             overall_confidence = np.mean(confidence_scores) if confidence_scores else 0.1
             
@@ -1071,11 +1450,9 @@ class LayoutClassifier:
             logger.error("Field mapping generation failed", error=str(e))
             return {"mappings": [], "confidence": 0.1, "detected_fields": []}
     
-    def _detect_headers(self, content: str) -> List[str]:
+    def _detect_headers(self, lines: List[str]) -> List[str]:
         """Detect header row in content"""
-        lines = content.split('\n')[:5]  # Check first 5 lines
-        
-        for line in lines:
+        for line in lines[:5]:  # Check first 5 lines
             if ',' in line or '|' in line or '\t' in line:
                 # Likely a header row with delimited fields
                 delimiters = [',', '|', '\t', ';']
@@ -1087,16 +1464,18 @@ class LayoutClassifier:
         
         return []
     
-    def _detect_delimiters(self, content: str) -> List[str]:
+    def _detect_delimiters(self, lines: List[str]) -> List[str]:
         """Detect possible delimiters in content"""
         candidates = [',', '|', '\t', ';', ':', ' ']
         detected = []
         
-        lines = content.split('\n')[:10]  # Sample first 10 lines
+        lines = lines[:10]  # Sample first 10 lines
+        
+        # One C-level character count over the sample instead of a scan per candidate
+        char_counts = Counter(''.join(lines))
         
         for delimiter in candidates:
-            delimiter_count = sum(line.count(delimiter) for line in lines)
-            if delimiter_count > len(lines):  # More delimiters than lines
+            if char_counts[delimiter] > len(lines):  # More delimiters than lines
                 detected.append(delimiter)
         
         return detected
@@ -1104,8 +1483,16 @@ class LayoutClassifier:
     def _count_carrier_keywords(self, content: str) -> Dict[str, int]:
         """Count carrier-specific keywords in content"""
         content_lower = content.lower()
-        keyword_counts = {}
         
+        if self._keyword_automaton is not None:
+            # Single linear pass matching every carrier keyword at once
+            keyword_counts = dict.fromkeys(self.carrier_patterns, 0)
+            for _, carriers in self._keyword_automaton.iter(content_lower):
+                for carrier in carriers:
+                    keyword_counts[carrier] += 1
+            return keyword_counts
+        
+        keyword_counts = {}
         for carrier, patterns in self.carrier_patterns.items():
             count = 0
             for keyword in patterns["keywords"]:
@@ -1135,24 +1522,7 @@ class LayoutClassifier:
     
     def _field_similarity(self, field1: str, field2: str) -> float:
         """Calculate similarity between two field names"""
-        field1 = field1.lower().replace(' ', '').replace('_', '').replace('-', '')
-        field2 = field2.lower().replace(' ', '').replace('_', '').replace('-', '')
-        
-        if field1 == field2:
-            return 1.0
-        
-        # Check if one contains the other
-        if field1 in field2 or field2 in field1:
-            return 0.8
-        
-        # Simple character overlap
-        common_chars = set(field1) & set(field2)
-        total_chars = set(field1) | set(field2)
-        
-        if total_chars:
-            return len(common_chars) / len(total_chars)
-        
-        return 0.0
+        return _signature_similarity(_field_signature(field1), _field_signature(field2))
     
     def _infer_data_type(self, target_field: str) -> str:
         """Infer data type from target field name"""
@@ -1169,44 +1539,45 @@ class LayoutClassifier:
         
         return type_mapping.get(target_field, "string")
     
-    def _detect_table_structure(self, content: str, file_format: str) -> Optional[Dict[str, Any]]:
+    def _detect_table_structure(self, ctx: _FileContext, file_format: str) -> Optional[Dict[str, Any]]:
         """Detect table structure in the content"""
         try:
-            lines = content.split('\n')
+            content = ctx.content
+            lines = ctx.head_lines
             
             if file_format == "csv":
                 # Detect CSV structure
                 delimiter = None
                 header_row = 0
                 
-                # Find most common delimiter
-                for candidate in [',', '|', '\t', ';']:
-                    if candidate in lines[0]:
-                        delimiter = candidate
-                        break
+                # Let the csv module sniff the dialect from the sample
+                try:
+                    delimiter = csv.Sniffer().sniff(content[:8192], delimiters=',|\t;').delimiter
+                except csv.Error:
+                    # Fall back to the first candidate present in the header line
+                    for candidate in [',', '|', '\t', ';']:
+                        if candidate in lines[0]:
+                            delimiter = candidate
+                            break
                 
                 if delimiter:
-                    # Analyze first few rows to detect structure
-                    sample_rows = lines[:5]
+                    # Parse the first few rows once (quoted fields included)
+                    rows = list(islice(csv.reader(lines, delimiter=delimiter), 5))
+                    header_fields = rows[0] if rows else []
+                    sample_rows = [row for row in rows[1:] if len(row) > 1]
                     columns = []
                     
-                    header_fields = lines[0].split(delimiter)
                     for i, field in enumerate(header_fields):
                         column_info = {
                             "index": i,
                             "name": field.strip(' "\''),
                             "data_type": "string",  # Default
-                            "sample_values": [],
+                            "sample_values": [
+                                row[i].strip(' "\'') for row in sample_rows if i < len(row)
+                            ],
                             "null_percentage": 0.0
                         }
                         
-                        # Collect sample values
-                        for row in sample_rows[1:]:
-                            if delimiter in row:
-                                values = row.split(delimiter)
-                                if i < len(values):
-                                    column_info["sample_values"].append(values[i].strip(' "\''))
-                        
                         # Infer data type from samples
                         if column_info["sample_values"]:
                             column_info["data_type"] = self._infer_column_type(column_info["sample_values"])
@@ -1252,36 +1623,21 @@ class LayoutClassifier:
         if not sample_values:
             return "string"
         
-        # Check for numbers
-        numeric_count = 0
-        date_count = 0
+        values = pd.Series([value.strip() for value in sample_values], dtype=object)
+        values = values[values != '']
+        total_samples = len(values)
         
-        for value in sample_values:
-            value = value.strip()
-            if not value:
-                continue
-                
-            # Check if numeric
-            try:
-                float(value)
-                numeric_count += 1
-                continue
-            except ValueError:
-                pass
-            
-            # Check if date/time
-            date_patterns = [
-                r'\d{1,2}[/-]\d{1,2}[/-]\d{2,4}',
-                r'\d{4}-\d{2}-\d{2}',
-                r'\d{1,2}:\d{2}(:\d{2})?'
-            ]
-            
-            for pattern in date_patterns:
-                if re.match(pattern, value):
-                    date_count += 1
-                    break
+        if not total_samples:
+            return "string"
+        
+        # Check for numbers: anything float() parses, including nan and inf
+        numeric_mask = values.str.match(NUMERIC_RE).to_numpy(dtype=bool)
+        
+        # Check if date/time (only among non-numeric values)
+        date_mask = values.str.match(_DATE_OR_TIME_RE.pattern).to_numpy(dtype=bool) & ~numeric_mask
         
-        total_samples = len([v for v in sample_values if v.strip()])
+        numeric_count = int(numeric_mask.sum())
+        date_count = int(date_mask.sum())
         
         if numeric_count > total_samples * 0.8:
             return "number"
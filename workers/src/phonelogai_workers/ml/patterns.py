@@ -0,0 +1,19 @@
+"""
+Text patterns shared by the layout classifier and the template manager
+
+Kept free of other imports so either module can use them without loading the
+other (and its models or template cache).
+"""
+
+import re
+
+# Exactly the strings float() parses (sign, exponent, digit underscores,
+# inf/nan, surrounding whitespace)
+NUMERIC_RE = re.compile(
+    r'\s*[+-]?(?:'
+    r'(?:\d(?:_?\d)*)?\.\d(?:_?\d)*(?:[eE][+-]?\d(?:_?\d)*)?'
+    r'|\d(?:_?\d)*\.?(?:[eE][+-]?\d(?:_?\d)*)?'
+    r'|inf(?:inity)?|nan'
+    r')\s*\Z',
+    re.IGNORECASE
+)
@@ -9,27 +9,247 @@ Implements advanced techniques to achieve:
 - Adaptive performance tuning
 """
 
+import asyncio
+import os
+import sys
 import time
-import psutil
 import threading
-from typing import Dict, List, Optional, Any, Callable, Iterator, Tuple
-from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from typing import TYPE_CHECKING, Dict, List, Optional, Any, Callable, Iterable, Iterator, Sequence, Tuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import multiprocessing
 from multiprocessing import cpu_count
 from pathlib import Path
 import structlog
 import numpy as np
-import pandas as pd
 from dataclasses import dataclass
-from queue import Queue, Empty
 import gc
 import pickle
+from collections import deque
 from contextlib import contextmanager
+from functools import lru_cache
+from itertools import islice
 
 from ..config import settings
 from ..utils.database import db_manager
 
+if TYPE_CHECKING:
+    import pandas as pd
+
+# DataFrames handed to worker processes travel as Arrow IPC streams in shared
+# memory when pyarrow is installed, instead of being pickled per batch
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:
+    pa = None
+
 logger = structlog.get_logger(__name__)
 
+_gc_lock = threading.Lock()
+_gc_depth = 0
+_gc_saved_threshold: Optional[Tuple[int, ...]] = None
+
+
+@contextmanager
+def _bulk_gc_threshold():
+    """Raise the generation-0 GC threshold for the duration of a bulk run
+    
+    Bulk pandas work allocates many short-lived container objects; a higher
+    threshold lets the collector run far less often on them. Nested and
+    concurrent runs share one override, and the previous thresholds are
+    restored when the last one exits.
+    """
+    global _gc_depth, _gc_saved_threshold
+    with _gc_lock:
+        if _gc_depth == 0:
+            _gc_saved_threshold = gc.get_threshold()
+            gc.set_threshold(100_000, 50, 10)
+        _gc_depth += 1
+    try:
+        yield
+    finally:
+        with _gc_lock:
+            _gc_depth -= 1
+            if _gc_depth == 0:
+                gc.set_threshold(*_gc_saved_threshold)
+
+
+def _detect_l2_cache_bytes(default: int = 256 * 1024) -> int:
+    """L2 cache size from settings, else Linux sysfs, else a 256KB default"""
+    if settings.l2_cache_bytes:
+        return settings.l2_cache_bytes
+    
+    try:
+        with open('/sys/devices/system/cpu/cpu0/cache/index2/size') as f:
+            size = f.read().strip().upper()  # e.g. "256K", "2048K", "1M"
+        multiplier = {'K': 1024, 'M': 1024 * 1024}.get(size[-1:], 1)
+        return int(size.rstrip('KM')) * multiplier
+    except (OSError, ValueError):
+        return default
+
+
+@dataclass(frozen=True)
+class _SharedFrame:
+    """Handle to a DataFrame serialized as an Arrow IPC stream in shared memory"""
+    name: str
+    size: int
+
+
+def _frame_to_shared_memory(df: 'pd.DataFrame') -> Tuple[Any, _SharedFrame]:
+    """Write a DataFrame into a new shared memory block; caller unlinks it"""
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    
+    # Size the stream first so the block can be written in place
+    mock = pa.MockOutputStream()
+    with pa.ipc.new_stream(mock, table.schema) as writer:
+        writer.write_table(table)
+    size = mock.size()
+    
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        buffer = pa.py_buffer(shm.buf)
+        sink = pa.FixedSizeBufferWriter(buffer)
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        sink.close()
+        # Arrow's views of shm.buf must be gone before the block can be closed
+        del writer, sink, buffer
+    except BaseException:
+        _release_shared_blocks([shm])
+        raise
+    
+    return shm, _SharedFrame(name=shm.name, size=size)
+
+
+def _frame_from_shared_memory(handle: _SharedFrame) -> 'pd.DataFrame':
+    """Rebuild a DataFrame from a shared memory handle (in the worker)"""
+    # The parent owns the block and unlinks it; this process must not track it
+    if sys.version_info >= (3, 13):
+        shm = shared_memory.SharedMemory(name=handle.name, track=False)
+    else:
+        # Attaching always registers the block. A resource tracker inherited
+        # from the parent already holds it and forgets it on the parent's
+        # unlink, so unregistering there would make that unlink fail. A
+        # tracker this worker started itself would unlink the block again (and
+        # warn about a leak) at exit, so the registration is withdrawn there.
+        shm = shared_memory.SharedMemory(name=handle.name)
+        if getattr(resource_tracker._resource_tracker, '_pid', None) is not None:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+    
+    try:
+        # Copy the stream out first: a DataFrame built zero-copy over the block
+        # would keep it mapped, and the parent may unlink it at any time
+        data = bytes(shm.buf[:handle.size])
+    finally:
+        shm.close()
+    
+    return pa.ipc.open_stream(data).read_all().to_pandas()
+
+
+def _release_shared_blocks(blocks: Sequence[Any], live_blocks: Optional[Dict[str, Any]] = None):
+    """Close and unlink shared memory blocks, dropping them from `live_blocks`"""
+    for shm in blocks:
+        if live_blocks is not None:
+            live_blocks.pop(shm.name, None)
+        shm.close()
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+@lru_cache(maxsize=None)
+def _pd():
+    """pandas, imported on first use (pool workers may never need it)"""
+    import pandas
+    return pandas
+
+
+@lru_cache(maxsize=None)
+def _psutil():
+    """psutil, imported on first use"""
+    import psutil
+    return psutil
+
+
+_PROC = None
+
+
+def _current_process():
+    """Process-wide psutil.Process handle, rebuilt after a fork changes the pid"""
+    global _PROC
+    if _PROC is None or _PROC.pid != os.getpid():
+        _PROC = _psutil().Process()
+    return _PROC
+
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+_HAS_STATM = os.path.exists('/proc/self/statm')
+
+
+def _rss_mb() -> float:
+    """Resident set size of this process in MB
+    
+    On Linux this is a single read of /proc/self/statm, much cheaper than
+    psutil's memory_info(); elsewhere it falls back to psutil.
+    """
+    if _HAS_STATM:
+        with open('/proc/self/statm', 'rb') as f:
+            rss_pages = int(f.read().split()[1])
+        return rss_pages * _PAGE_SIZE / 1024 / 1024
+    return _current_process().memory_info().rss / 1024 / 1024
+
+
+def _numba_available() -> bool:
+    """Whether numba can be imported (it is an optional dependency)"""
+    try:
+        import numba  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+@lru_cache(maxsize=None)
+def _jit(function: Callable) -> Callable:
+    """Compile a processing function once per process (keyed on the function)"""
+    from numba import njit
+    return njit(cache=True, nogil=True)(function)
+
+
+@lru_cache(maxsize=None)
+def _process_context():
+    """Multiprocessing context for worker pools
+    
+    With forkserver, heavy modules are imported once in the server and every
+    worker (including respawns) forks from it already warm. Falls back to the
+    platform default where forkserver is unavailable.
+    """
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context()
+    
+    context = multiprocessing.get_context('forkserver')
+    # Only side-effect-free libraries: this module would pull in settings and
+    # the database layer. Missing optional modules are skipped by the server
+    context.set_forkserver_preload(['numpy', 'pandas', 'numba'])
+    return context
+
+
+def _warm_jit():
+    """Pool initializer: load numba's compiler before the first batch arrives"""
+    from numba import njit
+    njit(lambda values: values.sum())(np.zeros(1))
+
+
+def _chunks(iterable: Iterable[Any], size: int) -> Iterator[Tuple[Any, ...]]:
+    """Yield successive tuples of up to `size` items from an iterable"""
+    iterator = iter(iterable)
+    while True:
+        chunk = tuple(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
 
 @dataclass
 class ProcessingMetrics:
@@ -66,12 +286,30 @@ class AdaptiveBatchProcessor:
         self.min_batch_size = 100
         self.max_batch_size = 50000
         self.current_batch_size = self.initial_batch_size
-        self.performance_history = []
+        # Only recent history matters; the deque drops older entries itself
+        self.performance_history = deque(maxlen=5)
         self.memory_threshold_mb = 1500  # 1.5GB threshold
         self.cpu_threshold_percent = 85
+        self.l2_cache_bytes = _detect_l2_cache_bytes()
         
-    def get_optimal_batch_size(self, estimated_rows: int, available_memory_mb: float) -> int:
-        """Calculate optimal batch size based on system resources and data size"""
+    @staticmethod
+    def estimate_row_bytes(df: 'pd.DataFrame') -> float:
+        """Average in-memory size of one row of a sample chunk"""
+        if len(df) == 0:
+            return 0.0
+        return float(df.memory_usage(deep=True).sum()) / len(df)
+        
+    def get_optimal_batch_size(
+        self,
+        estimated_rows: int,
+        available_memory_mb: float,
+        row_bytes: Optional[float] = None
+    ) -> int:
+        """Calculate optimal batch size based on system resources and data size
+        
+        When row_bytes is known (see estimate_row_bytes), batches are also capped
+        so that one batch fits in the L2 cache.
+        """
         
         # Base calculation on available memory
         estimated_mb_per_1k_rows = 10  # Rough estimate
@@ -93,12 +331,18 @@ class AdaptiveBatchProcessor:
         
         # Take minimum of memory and size constraints
         optimal_size = min(memory_based_batch, size_adjusted)
+        
+        if row_bytes:
+            cache_fit_batch = max(1024, int(self.l2_cache_bytes / row_bytes))
+            optimal_size = min(optimal_size, cache_fit_batch)
+        
         optimal_size = max(optimal_size, self.min_batch_size)
         
         logger.info(
             "Calculated optimal batch size",
             estimated_rows=estimated_rows,
             available_memory_mb=available_memory_mb,
+            row_bytes=row_bytes,
             optimal_batch_size=optimal_size
         )
         
@@ -109,10 +353,6 @@ class AdaptiveBatchProcessor:
         
         self.performance_history.append(performance_metrics)
         
-        # Keep only recent history
-        if len(self.performance_history) > 5:
-            self.performance_history = self.performance_history[-5:]
-        
         # Don't adjust until we have some history
         if len(self.performance_history) < 2:
             return
@@ -166,14 +406,20 @@ class PerformanceMonitor:
     
     def __init__(self):
         self.monitoring = False
-        self.metrics_queue = Queue()
+        # Set to stop the monitor thread; also wakes it from its wait at once
+        self._stop = threading.Event()
         self.monitor_thread = None
-        self.process = psutil.Process()
+        self.process = _current_process()
+        # Prime the non-blocking CPU counter; later calls report usage since
+        # the previous call
+        self.process.cpu_percent(None)
         
     def start_monitoring(self) -> ProcessingMetrics:
         """Start performance monitoring"""
         metrics = ProcessingMetrics(start_time=time.time())
         self.monitoring = True
+        self._stop.clear()
+        self.process.cpu_percent(None)  # Reset the CPU interval for this run
         
         self.monitor_thread = threading.Thread(
             target=self._monitor_resources,
@@ -187,6 +433,7 @@ class PerformanceMonitor:
     def stop_monitoring(self, metrics: ProcessingMetrics):
         """Stop monitoring and finalize metrics"""
         self.monitoring = False
+        self._stop.set()
         
         if self.monitor_thread:
             self.monitor_thread.join(timeout=1.0)
@@ -197,57 +444,81 @@ class PerformanceMonitor:
         
         # Collect final resource usage
         try:
-            memory_info = self.process.memory_info()
-            metrics.memory_peak_mb = max(
-                metrics.memory_peak_mb,
-                memory_info.rss / 1024 / 1024
-            )
+            metrics.memory_peak_mb = max(metrics.memory_peak_mb, _rss_mb())
         except:
             pass
     
     def _monitor_resources(self, metrics: ProcessingMetrics):
         """Monitor system resources in background thread"""
-        cpu_samples = []
+        # Mean over the most recent samples, kept as a ring buffer plus a
+        # running sum so each update is O(1) with no list reallocation
+        window = 50
+        cpu_samples = np.zeros(window, dtype=np.float64)
+        cpu_sum = 0.0
+        cpu_count = 0
         
-        while self.monitoring:
+        while True:
             try:
                 # Monitor memory
-                memory_info = self.process.memory_info()
-                memory_mb = memory_info.rss / 1024 / 1024
-                metrics.memory_peak_mb = max(metrics.memory_peak_mb, memory_mb)
-                
-                # Monitor CPU
-                cpu_percent = self.process.cpu_percent(interval=0.1)
-                cpu_samples.append(cpu_percent)
+                metrics.memory_peak_mb = max(metrics.memory_peak_mb, _rss_mb())
                 
-                # Keep only recent samples
-                if len(cpu_samples) > 50:
-                    cpu_samples = cpu_samples[-50:]
+                # Monitor CPU (non-blocking; the wait below sets the interval)
+                cpu_percent = self.process.cpu_percent(None)
+                slot = cpu_count % window
+                cpu_sum += cpu_percent - cpu_samples[slot]
+                cpu_samples[slot] = cpu_percent
+                cpu_count += 1
                 
-                metrics.cpu_avg_percent = np.mean(cpu_samples)
-                
-                time.sleep(0.5)
+                metrics.cpu_avg_percent = cpu_sum / min(cpu_count, window)
                 
             except Exception as e:
                 logger.warning("Error monitoring resources", error=str(e))
                 break
+            
+            # Sleep until the next sample, returning early once stopped
+            if self._stop.wait(0.5):
+                break
 
 
 class ParallelProcessor:
     """High-performance parallel processor for large datasets"""
     
-    def __init__(self, max_workers: Optional[int] = None):
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        executor_cls: Optional[type] = None,
+        initializer: Optional[Callable[[], None]] = None,
+        jit: bool = False
+    ):
         self.max_workers = max_workers or min(cpu_count(), 8)
+        # None picks per call: processes for picklable (CPU-bound) functions,
+        # threads otherwise. Pass ThreadPoolExecutor for I/O-bound work.
+        self.executor_cls = executor_cls
+        # Runs once per worker, e.g. to warm heavy imports
+        self.initializer = initializer
+        # Compile processing functions with numba (nopython, nogil) and feed
+        # them each batch as one NumPy array; only for numeric kernels
+        self.jit = jit and _numba_available()
+        if jit and not self.jit:
+            logger.warning("numba is not installed; running processing functions uncompiled")
+        # Job status is written at most once per interval, unless progress
+        # has advanced by at least the given fraction since the last write
+        self.status_update_interval_seconds = 1.0
+        self.status_update_min_progress = 0.05
+        # Batches submitted but not yet collected; bounds how many batches
+        # (and shared-memory DataFrame copies) exist at once
+        self.max_in_flight_batches = self.max_workers * 2
         self.batch_processor = AdaptiveBatchProcessor()
         self.performance_monitor = PerformanceMonitor()
         
-    def process_in_parallel(
+    async def process_in_parallel(
         self,
         data_iterator: Iterator[Any],
         processing_function: Callable,
         total_rows: Optional[int] = None,
         job_id: Optional[str] = None,
-        progress_callback: Optional[Callable[[int, int], None]] = None
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        row_bytes: Optional[float] = None
     ) -> Tuple[List[Any], ProcessingMetrics]:
         """
         Process data in parallel with adaptive batching
@@ -258,150 +529,239 @@ class ParallelProcessor:
             total_rows: Estimated total number of rows
             job_id: Optional job ID for progress tracking
             progress_callback: Optional callback for progress updates
+            row_bytes: Optional bytes per item, to size batches to the L2 cache
             
         Returns:
             Tuple of (results, performance_metrics)
         """
         
-        # Start performance monitoring
-        metrics = self.performance_monitor.start_monitoring()
-        
-        try:
-            # Determine optimal batch size
-            available_memory = psutil.virtual_memory().available / 1024 / 1024  # MB
-            batch_size = self.batch_processor.get_optimal_batch_size(
-                total_rows or 100000,
-                available_memory
-            )
-            
-            results = []
-            processed_count = 0
-            batch_count = 0
-            
-            logger.info(
-                "Starting parallel processing",
-                max_workers=self.max_workers,
-                initial_batch_size=batch_size,
-                estimated_rows=total_rows,
-                job_id=job_id
-            )
+        with _bulk_gc_threshold():
+            # Start performance monitoring
+            metrics = self.performance_monitor.start_monitoring()
+            # Shared memory blocks not yet released, by name
+            live_blocks: Dict[str, Any] = {}
             
-            # Process data in batches
-            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-                batch_futures = {}
+            try:
+                # Determine optimal batch size
+                available_memory = _psutil().virtual_memory().available / 1024 / 1024  # MB
+                batch_size = self.batch_processor.get_optimal_batch_size(
+                    total_rows or 100000,
+                    available_memory,
+                    row_bytes=row_bytes
+                )
                 
-                # Create batches and submit for processing
-                current_batch = []
+                results = []
+                processed_count = 0
+                batch_count = 0
+                last_status_time = time.monotonic()
+                last_status_progress = 0.0
+                status_pending = False
                 
-                for item in data_iterator:
-                    current_batch.append(item)
-                    
-                    if len(current_batch) >= batch_size:
-                        # Submit batch for processing
-                        future = executor.submit(
-                            self._process_batch_with_monitoring,
-                            current_batch.copy(),
-                            processing_function,
-                            batch_count
-                        )
-                        batch_futures[future] = len(current_batch)
-                        current_batch = []
-                        batch_count += 1
+                executor_cls = self._select_executor(processing_function)
+                
+                logger.info(
+                    "Starting parallel processing",
+                    max_workers=self.max_workers,
+                    executor=executor_cls.__name__,
+                    initial_batch_size=batch_size,
+                    estimated_rows=total_rows,
+                    job_id=job_id
+                )
                 
-                # Submit final batch if not empty
-                if current_batch:
-                    future = executor.submit(
-                        self._process_batch_with_monitoring,
-                        current_batch,
-                        processing_function,
-                        batch_count
+                async def update_status():
+                    nonlocal last_status_time, last_status_progress, status_pending
+                    progress = processed_count / total_rows if total_rows else 0
+                    last_status_time = time.monotonic()
+                    last_status_progress = progress
+                    status_pending = False
+                    await db_manager.update_job_status(
+                        job_id=job_id,
+                        status="processing",
+                        progress=progress,
+                        processed_rows=processed_count,
+                        total_rows=total_rows
                     )
-                    batch_futures[future] = len(current_batch)
                 
-                # Collect results as batches complete
-                for future in as_completed(batch_futures):
-                    try:
-                        batch_results, batch_metrics = future.result()
-                        results.extend(batch_results)
-                        
-                        batch_size_used = batch_futures[future]
-                        processed_count += batch_size_used
-                        metrics.rows_processed = processed_count
-                        
-                        # Update batch processor with performance feedback
-                        self.batch_processor.adjust_batch_size(batch_metrics)
-                        batch_size = self.batch_processor.current_batch_size
-                        
-                        # Progress reporting
-                        if progress_callback and total_rows:
-                            progress_callback(processed_count, total_rows)
-                        
-                        # Update job status
-                        if job_id:
-                            progress = processed_count / total_rows if total_rows else 0
-                            await db_manager.update_job_status(
-                                job_id=job_id,
-                                status="processing",
-                                progress=progress,
-                                processed_rows=processed_count,
-                                total_rows=total_rows
+                share_frames = pa is not None and issubclass(executor_cls, ProcessPoolExecutor)
+                
+                executor_kwargs = {
+                    "max_workers": self.max_workers,
+                    "initializer": self.initializer,
+                }
+                if issubclass(executor_cls, ProcessPoolExecutor):
+                    executor_kwargs["mp_context"] = _process_context()
+                    if self.initializer is None and self.jit:
+                        executor_kwargs["initializer"] = _warm_jit
+                
+                # Process data in batches
+                with executor_cls(**executor_kwargs) as executor:
+                    in_flight: Dict[asyncio.Future, Tuple[int, List[Any]]] = {}
+                    batches = _chunks(data_iterator, batch_size)
+                    exhausted = False
+                    
+                    while in_flight or not exhausted:
+                        # Top up the pool; each chunk is materialized once and
+                        # owned by its batch until that batch is collected
+                        while not exhausted and len(in_flight) < self.max_in_flight_batches:
+                            batch = next(batches, None)
+                            if batch is None:
+                                exhausted = True
+                                break
+                            
+                            shared_blocks = []
+                            if share_frames:
+                                batch, shared_blocks = self._share_frames(batch)
+                                live_blocks.update((shm.name, shm) for shm in shared_blocks)
+                            
+                            future = executor.submit(
+                                self._process_batch_with_monitoring,
+                                batch,
+                                processing_function,
+                                batch_count,
+                                bool(shared_blocks),
+                                self.jit
                             )
+                            in_flight[asyncio.wrap_future(future)] = (len(batch), shared_blocks)
+                            batch_count += 1
                         
-                        logger.debug(
-                            "Batch completed",
-                            batch_size=batch_size_used,
-                            processed_total=processed_count,
-                            throughput=batch_metrics.throughput_rows_per_sec
-                        )
+                        if not in_flight:
+                            break
                         
-                    except Exception as e:
-                        logger.error("Batch processing failed", error=str(e))
-                        metrics.errors_count += 1
-            
-            metrics.rows_processed = processed_count
-            
-            logger.info(
-                "Parallel processing completed",
-                total_processed=processed_count,
-                total_batches=batch_count,
-                errors=metrics.errors_count
-            )
-            
-            return results, metrics
-            
-        except Exception as e:
-            logger.error("Parallel processing failed", error=str(e))
-            metrics.errors_count += 1
+                        # Collect results as batches complete, without blocking
+                        # the event loop
+                        done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                        for next_batch in done:
+                            batch_size_used, shared_blocks = in_flight.pop(next_batch)
+                            _release_shared_blocks(shared_blocks, live_blocks)
+                            try:
+                                batch_results, batch_metrics = next_batch.result()
+                                results.extend(batch_results)
+                                
+                                processed_count += batch_size_used
+                                metrics.rows_processed = processed_count
+                                
+                                # Update batch processor with performance feedback
+                                self.batch_processor.adjust_batch_size(batch_metrics)
+                                batch_size = self.batch_processor.current_batch_size
+                                
+                                # Progress reporting
+                                if progress_callback and total_rows:
+                                    progress_callback(processed_count, total_rows)
+                                
+                                # Update job status, throttled by time and progress
+                                status_pending = True
+                                if job_id:
+                                    progress = processed_count / total_rows if total_rows else 0
+                                    if (
+                                        time.monotonic() - last_status_time >= self.status_update_interval_seconds
+                                        or progress - last_status_progress >= self.status_update_min_progress
+                                    ):
+                                        await update_status()
+                                
+                                logger.debug(
+                                    "Batch completed",
+                                    batch_size=batch_size_used,
+                                    processed_total=processed_count,
+                                    throughput=batch_metrics.throughput_rows_per_sec
+                                )
+                            
+                            except Exception as e:
+                                logger.error("Batch processing failed", error=str(e))
+                                metrics.errors_count += 1
+                
+                # Flush the final progress
+                if job_id and status_pending:
+                    await update_status()
+                
+                metrics.rows_processed = processed_count
+                
+                logger.info(
+                    "Parallel processing completed",
+                    total_processed=processed_count,
+                    total_batches=batch_count,
+                    errors=metrics.errors_count
+                )
+                
+                return results, metrics
+                
+            except Exception as e:
+                logger.error("Parallel processing failed", error=str(e))
+                metrics.errors_count += 1
+                raise
+                
+            finally:
+                # Stop monitoring and calculate final metrics
+                self.performance_monitor.stop_monitoring(metrics)
+                
+                # Release blocks of batches that were never collected, e.g. when
+                # sharing or submitting a later batch failed
+                _release_shared_blocks(list(live_blocks.values()), live_blocks)
+                
+                # Collect the young generations; full collections are left to
+                # memory_limit_context under real memory pressure
+                gc.collect(1)
+    
+    def _select_executor(self, processing_function: Callable) -> type:
+        """Pick the executor class for a processing function"""
+        if self.executor_cls is not None:
+            return self.executor_cls
+        
+        # Pure-Python batch work is serialized by the GIL in threads; use
+        # processes whenever the function can be shipped to them
+        try:
+            pickle.dumps(processing_function, protocol=pickle.HIGHEST_PROTOCOL)
+            return ProcessPoolExecutor
+        except Exception:
+            return ThreadPoolExecutor
+    
+    @staticmethod
+    def _share_frames(batch: Sequence[Any]) -> Tuple[Tuple[Any, ...], List[Any]]:
+        """Move DataFrame items of a batch into shared memory for worker processes"""
+        pd = _pd()
+        items = []
+        shared_blocks = []
+        try:
+            for item in batch:
+                if isinstance(item, pd.DataFrame):
+                    shm, item = _frame_to_shared_memory(item)
+                    shared_blocks.append(shm)
+                items.append(item)
+        except BaseException:
+            _release_shared_blocks(shared_blocks)
             raise
-            
-        finally:
-            # Stop monitoring and calculate final metrics
-            self.performance_monitor.stop_monitoring(metrics)
-            
-            # Force garbage collection
-            gc.collect()
+        return tuple(items), shared_blocks
     
+    @staticmethod
     def _process_batch_with_monitoring(
-        self,
-        batch: List[Any],
+        batch: Sequence[Any],
         processing_function: Callable,
-        batch_id: int
+        batch_id: int,
+        has_shared_frames: bool = False,
+        use_jit: bool = False
     ) -> Tuple[List[Any], ProcessingMetrics]:
         """Process a single batch with performance monitoring"""
         
+        if has_shared_frames:
+            batch = tuple(
+                _frame_from_shared_memory(item) if isinstance(item, _SharedFrame) else item
+                for item in batch
+            )
+        
         batch_metrics = ProcessingMetrics(start_time=time.time())
         batch_metrics.rows_processed = len(batch)
         
         try:
             # Monitor memory before processing
-            process = psutil.Process()
-            memory_before = process.memory_info().rss / 1024 / 1024
+            memory_before = _rss_mb()
             
             # Process the batch
-            batch_results = processing_function(batch)
+            if use_jit:
+                batch_results = _jit(processing_function)(np.asarray(batch))
+            else:
+                batch_results = processing_function(batch)
             
             # Monitor memory after processing
-            memory_after = process.memory_info().rss / 1024 / 1024
+            memory_after = _rss_mb()
             batch_metrics.memory_peak_mb = max(memory_before, memory_after)
             
             batch_metrics.end_time = time.time()
@@ -439,7 +799,11 @@ class MemoryOptimizer:
                     current_memory=current_memory,
                     threshold=self.memory_threshold_mb
                 )
-                gc.collect()
+                # Full collection only when close to the limit
+                if current_memory > self.memory_threshold_mb * 0.95:
+                    gc.collect()
+                else:
+                    gc.collect(1)
                 
                 # Check memory again after GC
                 after_gc_memory = self.get_current_memory_mb()
@@ -453,38 +817,63 @@ class MemoryOptimizer:
     def get_current_memory_mb(self) -> float:
         """Get current memory usage in MB"""
         try:
-            process = psutil.Process()
-            return process.memory_info().rss / 1024 / 1024
+            return _rss_mb()
         except:
             return 0.0
     
-    def optimize_pandas_dtypes(self, df: pd.DataFrame) -> pd.DataFrame:
+    @staticmethod
+    def estimate_memory_mb(df: 'pd.DataFrame', sample_rows: int = 10_000) -> float:
+        """Estimate a DataFrame's deep memory usage in MB
+        
+        Only object columns need a per-value walk to size their Python
+        objects; that walk runs on a row sample and is scaled up.
+        """
+        usage = df.memory_usage(deep=False)
+        object_columns = df.select_dtypes(include=['object']).columns
+        n_rows = len(df)
+        
+        if n_rows and len(object_columns):
+            objects = df[object_columns]
+            if n_rows > sample_rows:
+                objects = objects.sample(sample_rows, random_state=0)
+            scale = n_rows / len(objects)
+            usage[object_columns] = objects.memory_usage(deep=True, index=False) * scale
+        
+        return float(usage.sum()) / 1024 / 1024
+    
+    def optimize_pandas_dtypes(self, df: 'pd.DataFrame') -> 'pd.DataFrame':
         """Optimize pandas DataFrame dtypes to reduce memory usage"""
+        pd = _pd()
+        
+        original_memory = self.estimate_memory_mb(df)
         
-        original_memory = df.memory_usage(deep=True).sum() / 1024 / 1024
+        n_rows = len(df)
         
-        # Optimize numeric columns
+        # Optimize numeric columns (smallest fitting int type in one pass)
         for col in df.select_dtypes(include=['int64']).columns:
-            col_min = df[col].min()
-            col_max = df[col].max()
-            
-            if col_min >= np.iinfo(np.int8).min and col_max <= np.iinfo(np.int8).max:
-                df[col] = df[col].astype(np.int8)
-            elif col_min >= np.iinfo(np.int16).min and col_max <= np.iinfo(np.int16).max:
-                df[col] = df[col].astype(np.int16)
-            elif col_min >= np.iinfo(np.int32).min and col_max <= np.iinfo(np.int32).max:
-                df[col] = df[col].astype(np.int32)
+            df[col] = pd.to_numeric(df[col], downcast='integer')
         
         # Optimize float columns
         for col in df.select_dtypes(include=['float64']).columns:
             df[col] = pd.to_numeric(df[col], downcast='float')
         
-        # Optimize object columns to category where beneficial
-        for col in df.select_dtypes(include=['object']).columns:
-            if df[col].nunique() / len(df) < 0.5:  # Less than 50% unique values
-                df[col] = df[col].astype('category')
+        # Optimize object columns to category where beneficial (an empty
+        # frame has no unique-value ratio)
+        if n_rows:
+            for col in df.select_dtypes(include=['object']).columns:
+                encoded = self._dictionary_encode(df[col])
+                if encoded is not None:
+                    # The dictionary already holds the unique non-null values
+                    if len(encoded.dictionary) / n_rows < 0.5:
+                        # Arrow orders categories by first appearance; sort them
+                        # as astype('category') does. Positional, independent
+                        # of the frame's index
+                        categorical = encoded.to_pandas().values
+                        df[col] = categorical.reorder_categories(categorical.categories.sort_values())
+                elif df[col].nunique() / n_rows < 0.5:  # Less than 50% unique values
+                    df[col] = df[col].astype('category')
         
-        optimized_memory = df.memory_usage(deep=True).sum() / 1024 / 1024
+        optimized_memory = self.estimate_memory_mb(df)
         memory_reduction = ((original_memory - optimized_memory) / original_memory) * 100
         
         logger.info(
@@ -496,18 +885,62 @@ class MemoryOptimizer:
         
         return df
     
+    @staticmethod
+    def _dictionary_encode(column: 'pd.Series') -> Optional[Any]:
+        """Dictionary-encode a string column with Arrow (C++, no nunique pass)
+        
+        Returns None when pyarrow is missing or the column holds non-string
+        objects, in which case the pandas path is used.
+        """
+        if pa is None:
+            return None
+        
+        try:
+            return pa.array(
+                column, type=pa.dictionary(pa.int32(), pa.string()), from_pandas=True
+            )
+        except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError):
+            return None
+    
+    @staticmethod
+    def contiguous_blocks(df: 'pd.DataFrame') -> Dict[str, Tuple[np.ndarray, List[str]]]:
+        """Split a DataFrame into one C-contiguous 2D array per dtype
+        
+        Returns {dtype name: (array of shape (rows, columns), column names)}.
+        Rows are contiguous in memory, so row-wise consumers and numeric kernels
+        read sequentially instead of striding across pandas' column blocks.
+        """
+        columns_by_dtype: Dict[str, List[str]] = {}
+        for col, dtype in df.dtypes.items():
+            columns_by_dtype.setdefault(str(dtype), []).append(col)
+        
+        return {
+            dtype: (np.ascontiguousarray(df[columns].to_numpy()), columns)
+            for dtype, columns in columns_by_dtype.items()
+        }
+    
     def chunked_processing(
         self,
         data_source: Any,
         chunk_size: int,
-        processing_function: Callable[[pd.DataFrame], Any]
+        processing_function: Callable[[Any], Any],
+        as_arrays: bool = False
     ) -> Iterator[Any]:
-        """Process large datasets in chunks to manage memory"""
+        """Process large datasets in chunks to manage memory
+        
+        With as_arrays=True, DataFrame chunks are handed to processing_function
+        as the dict produced by contiguous_blocks() instead of a DataFrame.
+        """
+        
+        pd = _pd()
         
         if isinstance(data_source, pd.DataFrame):
             # Process DataFrame in chunks
             for i in range(0, len(data_source), chunk_size):
-                chunk = data_source.iloc[i:i + chunk_size].copy()
+                if as_arrays:
+                    chunk = self.contiguous_blocks(data_source.iloc[i:i + chunk_size])
+                else:
+                    chunk = data_source.iloc[i:i + chunk_size].copy()
                 
                 with self.memory_limit_context():
                     result = processing_function(chunk)
@@ -520,7 +953,17 @@ class MemoryOptimizer:
             # Process file in chunks
             chunk_count = 0
             
+            # Arrow's multithreaded reader needs a binary stream
+            if pa is not None and isinstance(data_source.read(0), bytes):
+                yield from self._arrow_csv_chunks(
+                    data_source, chunk_size, processing_function, as_arrays
+                )
+                return
+            
             for chunk in pd.read_csv(data_source, chunksize=chunk_size):
+                if as_arrays:
+                    chunk = self.contiguous_blocks(chunk)
+                
                 with self.memory_limit_context():
                     result = processing_function(chunk)
                     yield result
@@ -528,7 +971,35 @@ class MemoryOptimizer:
                 chunk_count += 1
                 
                 if chunk_count % 10 == 0:  # Every 10 chunks
-                    gc.collect()
+                    gc.collect(1)
+    
+    def _arrow_csv_chunks(
+        self,
+        data_source: Any,
+        chunk_size: int,
+        processing_function: Callable[[Any], Any],
+        as_arrays: bool
+    ) -> Iterator[Any]:
+        """CSV branch of chunked_processing using pyarrow's streaming reader"""
+        reader = pa_csv.open_csv(
+            data_source,
+            read_options=pa_csv.ReadOptions(block_size=8 << 20)
+        )
+        
+        for record_batch in reader:
+            # Arrow batches are sized in bytes; re-slice them to chunk_size rows
+            for offset in range(0, record_batch.num_rows, chunk_size):
+                table = pa.Table.from_batches([record_batch.slice(offset, chunk_size)])
+                # self_destruct releases Arrow buffers as columns convert
+                chunk = table.to_pandas(split_blocks=True, self_destruct=True)
+                del table
+                
+                if as_arrays:
+                    chunk = self.contiguous_blocks(chunk)
+                
+                with self.memory_limit_context():
+                    result = processing_function(chunk)
+                    yield result
 
 
 class PerformanceProfiler:
@@ -547,13 +1018,13 @@ class PerformanceProfiler:
         """Profile a processing step and collect performance data"""
         
         start_time = time.time()
-        start_memory = psutil.Process().memory_info().rss / 1024 / 1024
+        start_memory = _rss_mb()
         
         try:
             result = processing_function(*args, **kwargs)
             
             end_time = time.time()
-            end_memory = psutil.Process().memory_info().rss / 1024 / 1024
+            end_memory = _rss_mb()
             
             profile_data = {
                 "duration_seconds": end_time - start_time,
@@ -9,8 +9,22 @@ This module manages:
 - Fallback manual mapping workflows
 """
 
+import io
+import re
+import asyncio
 import json
 import hashlib
+import os
+import sys
+import time
+import atexit
+import heapq
+import threading
+import weakref
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from operator import itemgetter
 from typing import Dict, List, Optional, Any, Tuple, Union
 from pathlib import Path
 from datetime import datetime, timezone
@@ -19,16 +33,156 @@ import structlog
 import pandas as pd
 import numpy as np
 from sklearn.cluster import DBSCAN
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+from sklearn.exceptions import NotFittedError
+from sklearn.neighbors import NearestNeighbors
 
 from ..config import settings
 from ..utils.database import db_manager
+from .patterns import NUMERIC_RE
+
+# orjson serialises dataclasses natively and is much faster than stdlib json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Hyperscan matches every rule keyword in one multi-pattern DFA pass
+try:
+    import hyperscan
+except ImportError:
+    hyperscan = None
 
 logger = structlog.get_logger(__name__)
 
+# Failures expected from a fitted field mapper on odd input; anything else
+# is a bug and should surface
+_PREDICT_ERRORS = (AttributeError, ValueError, NotFittedError)
 
-@dataclass
+# Slotted dataclasses drop the per-instance __dict__ (Python 3.10+)
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+# Raw char n-gram counts of field names, as TfidfVectorizer(analyzer='char',
+# ngram_range=(2, 4)) counts them. Hashing has no vocabulary, so n-grams no
+# template contains still land in a column (with the highest IDF) and count
+# towards a query's norm instead of being dropped
+_FIELD_COUNTER = HashingVectorizer(
+    analyzer='char',
+    ngram_range=(2, 4),
+    n_features=2 ** 20,
+    alternate_sign=False,
+    norm=None
+)
+
+# Prefix match for ISO, dashed and slashed dates and clock times
+_DATE_RE = re.compile(r'\d{4}-\d{2}-\d{2}|\d{1,2}-\d{1,2}-\d{4}|\d{1,2}/\d{1,2}/\d{2}|\d{1,2}:\d{2}')
+
+# Display names for the standard target fields offered in manual mapping
+STANDARD_FIELDS: Dict[str, str] = {
+    "ts": "Timestamp/Date",
+    "number": "Phone Number",
+    "duration": "Call Duration",
+    "type": "Call/SMS Type",
+    "direction": "Call Direction",
+    "content": "Message Content",
+    "cost": "Cost/Charges",
+    "location": "Location/Area"
+}
+
+# Validation regex per target field and inferred data type
+_VALIDATION_PATTERNS: Dict[str, Dict[str, str]] = {
+    "ts": {
+        "date": r'^\d{4}-\d{2}-\d{2}|\d{1,2}/\d{1,2}/\d{4}$',
+        "string": r'^\d{1,2}[/-]\d{1,2}[/-]\d{2,4}(\s+\d{1,2}:\d{2}(:\d{2})?)?$'
+    },
+    "number": {
+        "string": r'^[\+]?[\d\s\-\(\)\.]+$'
+    },
+    "duration": {
+        "number": r'^\d+(\.\d+)?$',
+        "string": r'^\d{1,2}:\d{2}(:\d{2})?|\d+$'
+    },
+    "cost": {
+        "number": r'^\d+(\.\d{2})?$',
+        "string": r'^\$?\d+(\.\d{2})?$'
+    }
+}
+
+# Rule-based field mapping keywords, in priority order: the first rule with a
+# keyword occurring anywhere in the field name wins
+_FIELD_KEYWORDS: List[Tuple[str, float, List[str]]] = [
+    ("ts", 0.8, ['date', 'time', 'timestamp', 'ts']),
+    ("number", 0.8, ['phone', 'number', 'caller', 'callee', 'ani', 'dnis']),
+    ("duration", 0.8, ['duration', 'minutes', 'seconds', 'length']),
+    ("type", 0.7, ['type', 'category', 'service']),
+    ("direction", 0.8, ['direction', 'in', 'out', 'inbound', 'outbound']),
+    ("content", 0.7, ['message', 'text', 'content', 'description']),
+    ("cost", 0.8, ['cost', 'charge', 'amount', 'price', 'fee']),
+    ("location", 0.7, ['location', 'city', 'state', 'area', 'region']),
+]
+
+# Keyword -> rule index (its priority), and one scan that reports, at every
+# position, the highest-priority keyword starting there: alternatives are
+# ordered by rule and the zero-width lookahead lets matches overlap
+_KEYWORD_RULE: Dict[str, int] = {
+    keyword: rule
+    for rule, (_, _, keywords) in reversed(list(enumerate(_FIELD_KEYWORDS)))
+    for keyword in keywords
+}
+_KEYWORD_SCAN_RE = re.compile(
+    '(?=(' + '|'.join(
+        re.escape(keyword)
+        for _, _, keywords in _FIELD_KEYWORDS
+        for keyword in keywords
+    ) + '))'
+)
+
+
+def _compile_keyword_database():
+    """Hyperscan database of all rule keywords, each reporting its rule index"""
+    if hyperscan is None:
+        return None
+    
+    try:
+        keywords = [
+            (keyword, rule)
+            for rule, (_, _, rule_keywords) in enumerate(_FIELD_KEYWORDS)
+            for keyword in rule_keywords
+        ]
+        database = hyperscan.Database()
+        database.compile(
+            expressions=[re.escape(keyword).encode() for keyword, _ in keywords],
+            ids=[rule for _, rule in keywords],
+            elements=len(keywords)
+        )
+        return database
+    except Exception as e:
+        logger.warning("Failed to compile hyperscan keyword database", error=str(e))
+        return None
+
+
+_KEYWORD_DB = _compile_keyword_database()
+# Hyperscan scratch space must not be shared between concurrent scans
+_keyword_scratch = threading.local()
+
+
+def _hyperscan_best_rule(field_lower: str) -> int:
+    """Lowest rule index whose keyword occurs in the field name, via hyperscan"""
+    scratch = getattr(_keyword_scratch, "scratch", None)
+    if scratch is None:
+        scratch = _keyword_scratch.scratch = hyperscan.Scratch(_KEYWORD_DB)
+    
+    matched = []
+    
+    def on_match(rule, start, end, flags, context):
+        matched.append(rule)
+    
+    _KEYWORD_DB.scan(field_lower.encode(), match_event_handler=on_match, scratch=scratch)
+    return min(matched, default=len(_FIELD_KEYWORDS))
+
+
+@dataclass(**_SLOTS)
 class TemplateField:
     """Represents a field in a carrier template"""
     source_name: str
@@ -44,7 +198,7 @@ class TemplateField:
             self.sample_values = []
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class CarrierTemplate:
     """Represents a complete carrier template"""
     template_id: str
@@ -63,10 +217,8 @@ class CarrierTemplate:
     
     def to_dict(self) -> Dict[str, Any]:
         """Convert template to dictionary for storage"""
-        return {
-            **asdict(self),
-            'fields': [asdict(field) for field in self.fields]
-        }
+        # asdict already recurses into the nested TemplateField instances
+        return asdict(self)
     
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'CarrierTemplate':
@@ -89,46 +241,385 @@ class CarrierTemplate:
         )
 
 
+def _dump_template(template: 'CarrierTemplate') -> bytes:
+    """Serialise a template to compact JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(template, default=str)
+    return json.dumps(template.to_dict(), separators=(',', ':'), default=str).encode()
+
+
+def _load_template(data: bytes) -> 'CarrierTemplate':
+    """Deserialise a template written by _dump_template"""
+    return CarrierTemplate.from_dict(orjson.loads(data) if orjson is not None else json.loads(data))
+
+
+def _read_template_file(path: Path) -> Tuple[Optional['CarrierTemplate'], Optional[str]]:
+    """Read one template file, returning the template or the error message"""
+    try:
+        return _load_template(path.read_bytes()), None
+    except Exception as e:
+        return None, str(e)
+
+
+@lru_cache(maxsize=16)
+def _class_display_info(classes: Tuple[str, ...]) -> Tuple[Tuple[str, str], ...]:
+    """(target_field, display_name) for each field mapper class, by class index"""
+    return tuple((cls, STANDARD_FIELDS.get(cls, cls)) for cls in classes)
+
+
+@lru_cache(maxsize=4096)
+def _rule_based_mapping(field_lower: str) -> Tuple[str, float]:
+    """Map a lowercased field name to (target_field, confidence) by keyword rules"""
+    # Single pass: the winning rule is the lowest rule index matched anywhere
+    if _KEYWORD_DB is not None:
+        best_rule = _hyperscan_best_rule(field_lower)
+    else:
+        best_rule = len(_FIELD_KEYWORDS)
+        for match in _KEYWORD_SCAN_RE.finditer(field_lower):
+            rule = _KEYWORD_RULE[match.group(1)]
+            if rule < best_rule:
+                best_rule = rule
+                if rule == 0:
+                    break
+    
+    if best_rule == len(_FIELD_KEYWORDS):
+        return "unknown", 0.1
+    
+    target_field, confidence, _ = _FIELD_KEYWORDS[best_rule]
+    return target_field, confidence
+
+
+@lru_cache(maxsize=1024)
+def _template_id(carrier: str, format_type: str, sorted_fields: Tuple[str, ...]) -> str:
+    """Template ID for a carrier, format and sorted field names"""
+    # Must derive the same IDs as templates already stored on disk and in the DB
+    content = f"{carrier}_{format_type}_{'_'.join(sorted_fields)}"
+    hash_object = hashlib.md5(content.encode())
+    return f"{carrier}_{format_type}_{hash_object.hexdigest()[:8]}"
+
+
+def _normalize_field_name(name: str) -> str:
+    """Normalise a raw header cell the same way field candidates are"""
+    return name.strip(' "\'()[]{}').lower().replace('-', '_').replace(' ', '_')
+
+
+@dataclass
+class _Context:
+    """File content split into lines once and shared by the discovery steps"""
+    content: str
+    lines: List[str]
+    header_line: str
+    delimiter: Optional[str] = None
+    # Leading rows parsed once with pandas, columns keyed by normalised name
+    head: Optional[pd.DataFrame] = None
+    # Header index and pre-split sample rows for the line-based fallback
+    _split: Optional[Tuple[Dict[str, int], List[List[str]]]] = None
+    
+    def parse_head(self, delimiter: str, nrows: int = 200):
+        """Parse the first rows of delimited content into ``head``"""
+        try:
+            head = pd.read_csv(
+                io.StringIO(self.content),
+                sep=delimiter,
+                nrows=nrows,
+                dtype=str,
+                on_bad_lines='skip',
+                engine='c'
+            )
+        except Exception as e:
+            logger.warning("Failed to parse content head", error=str(e))
+            return
+        
+        head.columns = [_normalize_field_name(str(column)) for column in head.columns]
+        self.head = head.loc[:, ~head.columns.duplicated()]
+    
+    def column_values(self, field_name: str) -> Optional[pd.Series]:
+        """Non-null values of a parsed column, or None when unavailable"""
+        if self.head is None or field_name not in self.head.columns:
+            return None
+        return self.head[field_name].dropna().str.strip(' "\'')
+    
+    def split_rows(self) -> Tuple[Dict[str, int], List[List[str]]]:
+        """Header name to column index and the first sample rows, split once"""
+        if self._split is None:
+            delimiter = self.delimiter or next(
+                (d for d in (',', '|', '\t') if d in self.header_line), None
+            )
+            if delimiter is None:
+                self._split = ({}, [])
+            else:
+                header_index = {}
+                for i, name in enumerate(self.header_line.split(delimiter)):
+                    header_index.setdefault(_normalize_field_name(name), i)
+                rows = [line.split(delimiter) for line in self.lines[1:20] if line.strip()]
+                self._split = (header_index, rows)
+        return self._split
+    
+    @classmethod
+    def from_content(cls, content: str) -> '_Context':
+        # split('\n'), not splitlines(): line counts, field candidates and the
+        # template IDs derived from them must stay as they were (a trailing
+        # newline yields an empty last line; '\r' stays on CRLF lines)
+        lines = content.split('\n')
+        return cls(content=content, lines=lines, header_line=lines[0] if lines else "")
+
+
+# Managers whose pending usage bumps are written at interpreter exit. Weak,
+# so managers created per task are not kept alive until then
+_LIVE_MANAGERS: 'weakref.WeakSet[TemplateManager]' = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_live_managers():
+    """Write every live manager's pending usage bumps before exit"""
+    for manager in list(_LIVE_MANAGERS):
+        manager.flush_templates()
+
+
 class TemplateManager:
     """Manages carrier templates with intelligent learning capabilities"""
     
     def __init__(self):
         self.templates: Dict[str, CarrierTemplate] = {}
+        # Templates bucketed by (carrier, format_type) for matching
+        self._by_key: Dict[Tuple[str, str], List[CarrierTemplate]] = defaultdict(list)
+        # One JSON file per template so a mutation rewrites only that record;
+        # the single-file cache is still read once to migrate older installs
         self.template_cache_path = Path(settings.model_cache_dir) / "carrier_templates.json"
+        self.template_dir = Path(settings.model_cache_dir) / "carrier_templates"
+        self.template_dir.mkdir(parents=True, exist_ok=True)
+        # Usage bumps from matching are batched and flushed at most this often;
+        # a background timer writes them even if no further bump arrives
+        self.usage_flush_interval_seconds = 30.0
+        self._dirty_templates: set = set()
+        self._flush_timer: Optional[threading.Timer] = None
+        self._flush_lock = threading.RLock()
+        # Background database writes started by discover_template
+        self._pending_writes: set = set()
+        self._last_usage_flush = time.monotonic()
         self.field_similarity_threshold = 0.75
         self.clustering_eps = 0.3
         self.min_samples = 2
+        # One IDF weighting over all templates' field names; each template's
+        # source names are transformed once and kept as an L2-normalised matrix
+        self._field_tfidf: Optional[TfidfTransformer] = None
+        self._known_ngrams: Optional[np.ndarray] = None
+        self._field_matrices: Dict[str, Any] = {}
+        self._vectorizer_stale = False
+        # Buckets with at least this many templates are matched through a
+        # per-bucket nearest-neighbour index over all their field vectors
+        self.nn_min_templates = 100
+        self.nn_neighbors = 5
+        self._bucket_nn: Dict[Tuple[str, str], Tuple[NearestNeighbors, List[str]]] = {}
+        self.parallel_load_min_files = 64
+        # Bound on first use so importing templates doesn't load the classifier models
+        self._layout_classifier = None
+        self.parallel_suggestion_min_candidates = 1024
         self._load_templates()
+        _LIVE_MANAGERS.add(self)
     
     def _load_templates(self):
         """Load existing templates from cache and database"""
         try:
-            # Load from file cache first
-            if self.template_cache_path.exists():
+            # Load from file cache first; large caches are read and decoded
+            # on a thread pool, registration stays on this thread
+            template_files = sorted(self.template_dir.glob("*.json"))
+            workers = min(8, os.cpu_count() or 1)
+            if len(template_files) >= self.parallel_load_min_files and workers > 1:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    results = list(executor.map(_read_template_file, template_files))
+            else:
+                results = [_read_template_file(path) for path in template_files]
+            
+            for template_file, (template, error) in zip(template_files, results):
+                if template is None:
+                    logger.warning(
+                        "Skipping unreadable template file",
+                        path=str(template_file),
+                        error=error
+                    )
+                    continue
+                self._register_template(template)
+            
+            if not template_files and self.template_cache_path.exists():
                 with open(self.template_cache_path, 'r') as f:
                     template_data = json.load(f)
                     
                 for template_dict in template_data:
                     template = CarrierTemplate.from_dict(template_dict)
-                    self.templates[template.template_id] = template
-                    
-                logger.info(f"Loaded {len(self.templates)} templates from cache")
+                    self._register_template(template)
+                    self._save_template(template.template_id)
+            
+            logger.info(f"Loaded {len(self.templates)} templates from cache")
             
         except Exception as e:
             logger.error("Failed to load templates from cache", error=str(e))
+        
+        self._fit_field_vectorizer()
     
-    def _save_templates(self):
-        """Save templates to cache file"""
-        try:
-            template_data = [template.to_dict() for template in self.templates.values()]
-            
-            with open(self.template_cache_path, 'w') as f:
-                json.dump(template_data, f, indent=2, default=str)
+    @property
+    def field_mapper(self):
+        """The layout classifier's field mapping model, or None if not loaded"""
+        # The model itself is looked up each time so retrains are picked up
+        if self._layout_classifier is None:
+            from .layout_classifier import layout_classifier
+            self._layout_classifier = layout_classifier
+        return self._layout_classifier.models.get("field_mapper")
+    
+    def _register_template(self, template: CarrierTemplate):
+        """Add or replace a template and keep the (carrier, format) index in step"""
+        key = (template.carrier, template.format_type)
+        bucket = self._by_key[key]
+        self._bucket_nn.pop(key, None)
+        if template.template_id in self.templates:
+            bucket[:] = [t for t in bucket if t.template_id != template.template_id]
+        bucket.append(template)
+        self.templates[template.template_id] = template
+    
+    def _fit_field_vectorizer(self):
+        """Fit the shared field IDF weights and precompute per-template matrices"""
+        self._vectorizer_stale = False
+        self._field_matrices = {}
+        self._bucket_nn = {}
+        
+        source_names = [
+            field.source_name
+            for template in self.templates.values()
+            for field in template.fields
+        ]
+        if not source_names:
+            self._field_tfidf = None
+            self._known_ngrams = None
+            return
+        
+        counts = _FIELD_COUNTER.transform(source_names)
+        self._field_tfidf = TfidfTransformer(norm='l2').fit(counts)
+        self._known_ngrams = np.diff(counts.tocsc().indptr) > 0
+        for template in self.templates.values():
+            self._index_template(template)
+    
+    def _field_vectors(self, names: List[str]):
+        """L2-normalised TF-IDF rows for field names under the shared IDF weights"""
+        return self._field_tfidf.transform(_FIELD_COUNTER.transform(names))
+    
+    def _index_template(self, template: CarrierTemplate):
+        """Precompute a template's field matrix, or mark the IDF weights for refit"""
+        source_names = [field.source_name for field in template.fields]
+        if not source_names:
+            return
+        
+        if self._field_tfidf is None:
+            self._vectorizer_stale = True
+            return
+        
+        # N-grams absent from the fitted templates would all carry the maximum
+        # IDF; refit so their document frequencies are counted
+        counts = _FIELD_COUNTER.transform(source_names)
+        if not self._known_ngrams[counts.indices].all():
+            self._vectorizer_stale = True
+            return
+        
+        self._field_matrices[template.template_id] = self._field_tfidf.transform(counts)
+        self._bucket_nn.pop((template.carrier, template.format_type), None)
+    
+    def _neighbour_similarities(
+        self,
+        key: Tuple[str, str],
+        bucket: List[CarrierTemplate],
+        query
+    ) -> Dict[str, float]:
+        """Per-template field similarity from a nearest-neighbour query over a bucket
+        
+        Each query field contributes its best match among its nearest template
+        fields, so templates with no field in a row's top-k count zero for it.
+        """
+        index = self._bucket_nn.get(key)
+        if index is None:
+            matrices = []
+            owners = []
+            for template in bucket:
+                field_matrix = self._field_matrices.get(template.template_id)
+                if field_matrix is not None:
+                    matrices.append(field_matrix)
+                    owners.extend([template.template_id] * field_matrix.shape[0])
+            if not matrices:
+                return {}
+            
+            field_vectors = sparse.vstack(matrices).tocsr()
+            nn = NearestNeighbors(
+                n_neighbors=min(self.nn_neighbors, field_vectors.shape[0]),
+                metric='cosine',
+                algorithm='brute'
+            ).fit(field_vectors)
+            index = self._bucket_nn[key] = (nn, owners)
+        
+        nn, owners = index
+        distances, indices = nn.kneighbors(query)
+        
+        totals: Dict[str, float] = defaultdict(float)
+        for row_distances, row_indices in zip(distances, indices):
+            seen = set()
+            # Neighbours are sorted nearest first, so a template's first hit is its row max
+            for distance, idx in zip(row_distances, row_indices):
+                template_id = owners[idx]
+                if template_id not in seen:
+                    seen.add(template_id)
+                    totals[template_id] += 1.0 - distance
+        
+        n_rows = query.shape[0]
+        return {template_id: total / n_rows for template_id, total in totals.items()}
+    
+    def _save_template(self, template_id: str):
+        """Atomically write a single template to its cache file"""
+        template = self.templates.get(template_id)
+        if template is None:
+            return
+        
+        # Serialised with the flush timer thread; the per-process temp name
+        # keeps workers sharing the cache directory from clobbering each other
+        with self._flush_lock:
+            # Cleared before the write so a bump landing mid-write stays dirty
+            self._dirty_templates.discard(template_id)
+            path = self.template_dir / f"{template_id}.json"
+            tmp_path = path.with_suffix(f".json.{os.getpid()}.tmp")
+            
+            try:
+                with open(tmp_path, 'wb') as f:
+                    f.write(_dump_template(template))
+                os.replace(tmp_path, path)
                 
-            logger.info(f"Saved {len(self.templates)} templates to cache")
-            
-        except Exception as e:
-            logger.error("Failed to save templates to cache", error=str(e))
+            except Exception as e:
+                self._dirty_templates.add(template_id)
+                logger.error("Failed to save template to cache", template_id=template_id, error=str(e))
+    
+    def _mark_template_used(self, template: CarrierTemplate):
+        """Record a usage bump, persisting pending bumps once the flush interval passes"""
+        template.usage_count += 1
+        template.last_updated = datetime.now(timezone.utc).isoformat()
+        self._dirty_templates.add(template.template_id)
+        
+        if time.monotonic() - self._last_usage_flush >= self.usage_flush_interval_seconds:
+            self.flush_templates()
+        else:
+            self._schedule_usage_flush()
+    
+    def _schedule_usage_flush(self):
+        """Flush pending usage bumps in the background once the interval passes"""
+        if self._flush_timer is not None and self._flush_timer.is_alive():
+            return
+        
+        timer = threading.Timer(self.usage_flush_interval_seconds, self.flush_templates)
+        timer.daemon = True
+        timer.start()
+        self._flush_timer = timer
+    
+    def flush_templates(self):
+        """Persist templates with pending usage updates"""
+        # Called from the flush timer thread as well as by tasks and atexit
+        with self._flush_lock:
+            for template_id in list(self._dirty_templates):
+                self._save_template(template_id)
+            self._last_usage_flush = time.monotonic()
     
     async def discover_template(
         self,
@@ -148,6 +639,11 @@ class TemplateManager:
             
         Returns:
             Newly discovered template or None if discovery fails
+        
+        The template is cached on disk before this returns; its database
+        save runs as a background task. The owner of the event loop must
+        await wait_for_pending_writes() before closing it, or the save is
+        cancelled.
         """
         try:
             logger.info(
@@ -157,21 +653,28 @@ class TemplateManager:
                 job_id=job_id
             )
             
+            ctx = _Context.from_content(file_content)
+            
             # Extract structural information
-            structure_info = self._analyze_file_structure(file_content, detected_format)
+            structure_info = self._analyze_file_structure(ctx, detected_format)
             if not structure_info:
                 return None
+            ctx.delimiter = structure_info.get("delimiter")
             
             # Extract field candidates
-            field_candidates = self._extract_field_candidates(file_content, structure_info)
+            field_candidates = self._extract_field_candidates(ctx, structure_info)
             if not field_candidates:
                 return None
             
+            # Parse leading rows once so per-field sampling is a column lookup
+            if structure_info.get("has_header") and structure_info.get("delimiter"):
+                ctx.parse_head(structure_info["delimiter"])
+            
             # Generate field mappings using ML and heuristics
             template_fields = await self._generate_template_fields(
                 field_candidates, 
                 detected_carrier,
-                file_content
+                ctx
             )
             
             # Create template ID
@@ -205,11 +708,15 @@ class TemplateManager:
             )
             
             # Store template
-            self.templates[template_id] = new_template
-            self._save_templates()
+            self._register_template(new_template)
+            self._index_template(new_template)
+            self._save_template(template_id)
             
-            # Save to database
-            await self._save_template_to_db(new_template, job_id)
+            # Save to database in the background; callers that own the event
+            # loop should await wait_for_pending_writes() before closing it
+            task = asyncio.create_task(self._save_template_to_db(new_template, job_id))
+            self._pending_writes.add(task)
+            task.add_done_callback(self._pending_writes.discard)
             
             logger.info(
                 "Template discovery completed",
@@ -252,25 +759,43 @@ class TemplateManager:
         try:
             matching_templates = []
             
-            for template in self.templates.values():
-                if template.carrier != carrier or template.format_type != format_type:
-                    continue
-                
+            if self._vectorizer_stale:
+                self._fit_field_vectorizer()
+            
+            # Transform the candidates once; each template is then a sparse dot product
+            query = None
+            if self._field_tfidf is not None and field_candidates:
+                query = self._field_vectors(field_candidates)
+            
+            bucket = self._by_key.get((carrier, format_type), ())
+            neighbour_sims = None
+            if query is not None and len(bucket) >= self.nn_min_templates:
+                neighbour_sims = self._neighbour_similarities((carrier, format_type), bucket, query)
+            
+            for template in bucket:
                 # Calculate field similarity
-                template_fields = [field.source_name for field in template.fields]
-                similarity = self._calculate_field_similarity(field_candidates, template_fields)
+                field_matrix = self._field_matrices.get(template.template_id)
+                if neighbour_sims is not None and field_matrix is not None:
+                    similarity = neighbour_sims.get(template.template_id, 0.0)
+                elif query is not None and field_matrix is not None:
+                    sims = query @ field_matrix.T
+                    similarity = float(sims.max(axis=1).toarray().mean())
+                else:
+                    template_fields = [field.source_name for field in template.fields]
+                    similarity = self._calculate_field_similarity(field_candidates, template_fields)
                 
                 if similarity >= confidence_threshold:
                     matching_templates.append((template, similarity))
+                    # Nothing later in the bucket can beat a perfect match
+                    if similarity >= 1.0:
+                        break
             
             if matching_templates:
                 # Return template with highest similarity
                 best_template, best_similarity = max(matching_templates, key=lambda x: x[1])
                 
                 # Update usage statistics
-                best_template.usage_count += 1
-                best_template.last_updated = datetime.now(timezone.utc).isoformat()
-                self._save_templates()
+                self._mark_template_used(best_template)
                 
                 logger.info(
                     "Found matching template",
@@ -287,10 +812,11 @@ class TemplateManager:
             logger.error("Failed to find matching template", error=str(e))
             return None
     
-    def _analyze_file_structure(self, content: str, format_type: str) -> Optional[Dict[str, Any]]:
+    def _analyze_file_structure(self, ctx: _Context, format_type: str) -> Optional[Dict[str, Any]]:
         """Analyze file structure to detect table layout"""
         try:
-            lines = content.split('\n')
+            lines = ctx.lines
+            content = ctx.content
             structure = {
                 "format_type": format_type,
                 "line_count": len(lines),
@@ -313,7 +839,7 @@ class TemplateManager:
                     
                     # Analyze columns
                     if lines:
-                        headers = lines[0].split(delimiter)
+                        headers = ctx.header_line.split(delimiter)
                         structure["columns"] = [
                             {
                                 "index": i,
@@ -349,22 +875,21 @@ class TemplateManager:
         delimiters = [',', '|', '\t', ';']
         delimiter_scores = {}
         
+        lines = [line for line in sample_lines if line.strip()]
+        if not lines:
+            return None
+        n = len(lines)
+        
         for delimiter in delimiters:
-            score = 0
-            field_counts = []
-            
-            for line in sample_lines:
-                if line.strip():
-                    field_count = len(line.split(delimiter))
-                    field_counts.append(field_count)
-                    
-                    if field_count > 1:
-                        score += 1
+            # str.count avoids materialising split lists; fields = separators + 1
+            field_counts = [line.count(delimiter) + 1 for line in lines]
+            score = sum(1 for count in field_counts if count > 1)
             
             # Consistent field count across lines is good
-            if field_counts:
-                consistency = 1.0 - (np.std(field_counts) / np.mean(field_counts) if np.mean(field_counts) > 0 else 1.0)
-                delimiter_scores[delimiter] = score * consistency
+            mean = sum(field_counts) / n
+            std = (sum((count - mean) ** 2 for count in field_counts) / n) ** 0.5
+            consistency = 1.0 - std / mean
+            delimiter_scores[delimiter] = score * consistency
         
         if delimiter_scores:
             best_delimiter = max(delimiter_scores, key=delimiter_scores.get)
@@ -375,14 +900,14 @@ class TemplateManager:
     
     def _extract_field_candidates(
         self,
-        content: str,
+        ctx: _Context,
         structure_info: Dict[str, Any]
     ) -> List[str]:
         """Extract potential field names from file content"""
         candidates = []
         
         try:
-            lines = content.split('\n')
+            lines = ctx.lines
             
             if structure_info.get("has_header") and structure_info.get("delimiter"):
                 # Extract from header row
@@ -434,37 +959,37 @@ class TemplateManager:
         self,
         field_candidates: List[str],
         carrier: str,
-        content: str
+        ctx: _Context
     ) -> List[TemplateField]:
         """Generate template fields with ML-powered mapping"""
         template_fields = []
         
         try:
             # Load field mapping model from layout classifier
-            from .layout_classifier import layout_classifier
-            field_mapper = layout_classifier.models.get("field_mapper")
-            
-            for candidate in field_candidates:
-                # Use ML model to predict target field
-                if field_mapper:
-                    try:
-                        predictions = field_mapper.predict_proba([candidate.lower()])
-                        if len(predictions) > 0:
-                            class_probabilities = predictions[0]
-                            predicted_class = field_mapper.predict([candidate.lower()])[0]
-                            confidence = float(np.max(class_probabilities))
-                        else:
-                            predicted_class = "unknown"
-                            confidence = 0.1
-                    except:
-                        predicted_class = "unknown"
-                        confidence = 0.1
-                else:
-                    # Fallback to rule-based mapping
-                    predicted_class, confidence = self._rule_based_field_mapping(candidate)
+            field_mapper = self.field_mapper
+            
+            # An unfitted model has no classes_; use the rules instead
+            if field_mapper is not None and hasattr(field_mapper, 'classes_'):
+                # Use ML model to predict all target fields in one batch
+                try:
+                    proba = field_mapper.predict_proba([candidate.lower() for candidate in field_candidates])
+                    best_idx = proba.argmax(axis=1)
+                    predictions = list(zip(
+                        field_mapper.classes_[best_idx].tolist(),
+                        proba[np.arange(len(best_idx)), best_idx].tolist()
+                    ))
+                except _PREDICT_ERRORS:
+                    predictions = [("unknown", 0.1)] * len(field_candidates)
+            else:
+                # Fallback to rule-based mapping
+                predictions = [self._rule_based_field_mapping(candidate) for candidate in field_candidates]
+            
+            for candidate, (predicted_class, confidence) in zip(field_candidates, predictions):
+                # Extract sample values once for type inference and the template
+                sample_values = self._extract_sample_values(candidate, ctx)
                 
                 # Infer data type
-                data_type = self._infer_data_type_from_content(candidate, content)
+                data_type = self._infer_data_type_from_content(candidate, sample_values)
                 
                 # Determine if field is required
                 is_required = predicted_class in ["ts", "number", "type", "direction"]
@@ -472,9 +997,6 @@ class TemplateManager:
                 # Generate validation pattern
                 validation_pattern = self._generate_validation_pattern(predicted_class, data_type)
                 
-                # Extract sample values
-                sample_values = self._extract_sample_values(candidate, content)
-                
                 template_field = TemplateField(
                     source_name=candidate,
                     target_field=predicted_class,
@@ -495,48 +1017,15 @@ class TemplateManager:
     
     def _rule_based_field_mapping(self, field_name: str) -> Tuple[str, float]:
         """Fallback rule-based field mapping"""
-        field_lower = field_name.lower()
-        
-        # Date/time patterns
-        if any(keyword in field_lower for keyword in ['date', 'time', 'timestamp', 'ts']):
-            return "ts", 0.8
-        
-        # Phone number patterns  
-        if any(keyword in field_lower for keyword in ['phone', 'number', 'caller', 'callee', 'ani', 'dnis']):
-            return "number", 0.8
-        
-        # Duration patterns
-        if any(keyword in field_lower for keyword in ['duration', 'minutes', 'seconds', 'length']):
-            return "duration", 0.8
-        
-        # Type patterns
-        if any(keyword in field_lower for keyword in ['type', 'category', 'service']):
-            return "type", 0.7
-        
-        # Direction patterns
-        if any(keyword in field_lower for keyword in ['direction', 'in', 'out', 'inbound', 'outbound']):
-            return "direction", 0.8
-        
-        # Content patterns
-        if any(keyword in field_lower for keyword in ['message', 'text', 'content', 'description']):
-            return "content", 0.7
-        
-        # Cost patterns
-        if any(keyword in field_lower for keyword in ['cost', 'charge', 'amount', 'price', 'fee']):
-            return "cost", 0.8
-        
-        # Location patterns
-        if any(keyword in field_lower for keyword in ['location', 'city', 'state', 'area', 'region']):
-            return "location", 0.7
-        
-        return "unknown", 0.1
+        return _rule_based_mapping(field_name.lower())
     
-    def _infer_data_type_from_content(self, field_name: str, content: str) -> str:
-        """Infer data type by analyzing sample values in content"""
+    def _infer_data_type_from_content(self, field_name: str, samples: List[str]) -> str:
+        """Infer data type from the field's extracted sample values
+        
+        The same samples are stored on the template field, so its data_type
+        never contradicts its sample_values.
+        """
         try:
-            # Extract sample values for this field
-            samples = self._extract_sample_values(field_name, content)
-            
             if not samples:
                 return "string"
             
@@ -557,88 +1046,48 @@ class TemplateManager:
             
             return "string"
             
-        except:
+        except Exception:
             return "string"
     
     def _is_numeric(self, value: str) -> bool:
         """Check if value is numeric"""
-        try:
-            float(value.replace(',', ''))
-            return True
-        except:
-            return False
+        # Thousands separators are stripped before the float() grammar check
+        return bool(NUMERIC_RE.match(value.replace(',', '')))
     
     def _is_date_like(self, value: str) -> bool:
         """Check if value looks like a date"""
-        import re
-        date_patterns = [
-            r'\d{4}-\d{2}-\d{2}',
-            r'\d{2}/\d{2}/\d{4}',
-            r'\d{1,2}-\d{1,2}-\d{4}',
-            r'\d{1,2}/\d{1,2}/\d{2}',
-            r'\d{1,2}:\d{2}(:\d{2})?',
-        ]
-        
-        return any(re.match(pattern, value.strip()) for pattern in date_patterns)
+        return bool(_DATE_RE.match(value.strip()))
     
     def _generate_validation_pattern(self, target_field: str, data_type: str) -> Optional[str]:
         """Generate regex validation pattern for field"""
-        patterns = {
-            "ts": {
-                "date": r'^\d{4}-\d{2}-\d{2}|\d{1,2}/\d{1,2}/\d{4}$',
-                "string": r'^\d{1,2}[/-]\d{1,2}[/-]\d{2,4}(\s+\d{1,2}:\d{2}(:\d{2})?)?$'
-            },
-            "number": {
-                "string": r'^[\+]?[\d\s\-\(\)\.]+$'
-            },
-            "duration": {
-                "number": r'^\d+(\.\d+)?$',
-                "string": r'^\d{1,2}:\d{2}(:\d{2})?|\d+$'
-            },
-            "cost": {
-                "number": r'^\d+(\.\d{2})?$',
-                "string": r'^\$?\d+(\.\d{2})?$'
-            }
-        }
-        
-        return patterns.get(target_field, {}).get(data_type)
+        return _VALIDATION_PATTERNS.get(target_field, {}).get(data_type)
     
-    def _extract_sample_values(self, field_name: str, content: str) -> List[str]:
+    def _extract_sample_values(self, field_name: str, ctx: _Context) -> List[str]:
         """Extract sample values for a specific field"""
         samples = []
         
         try:
-            lines = content.split('\n')[:20]  # Sample first 20 lines
-            
-            for line in lines[1:]:  # Skip header
-                if not line.strip():
-                    continue
-                
-                # Try different parsing approaches
-                if ',' in line:
-                    parts = line.split(',')
-                elif '|' in line:
-                    parts = line.split('|')
-                elif '\t' in line:
-                    parts = line.split('\t')
-                else:
-                    continue
-                
-                # Try to find the field and extract its value
-                for i, part in enumerate(parts):
-                    clean_part = part.strip(' "\'')
-                    if clean_part and len(clean_part) < 100:
-                        samples.append(clean_part)
-                        
+            column = ctx.column_values(field_name)
+            if column is not None:
+                return [value for value in column.head(20).tolist() if 0 < len(value) < 100][:5]
+            
+            # Candidates are normalised header names; nothing to sample otherwise
+            header_index, rows = ctx.split_rows()
+            col_index = header_index.get(field_name.lower())
+            if col_index is None:
+                return []
+            
+            for row in rows:
+                if col_index < len(row):
+                    value = row[col_index].strip(' "\'')
+                    if value and len(value) < 100:
+                        samples.append(value)
                         if len(samples) >= 5:  # Limit sample size
                             break
-                
-                if len(samples) >= 5:
-                    break
             
             return samples[:5]
             
-        except:
+        except Exception:
             return []
     
     def _calculate_field_similarity(self, fields1: List[str], fields2: List[str]) -> float:
@@ -646,37 +1095,14 @@ class TemplateManager:
         if not fields1 or not fields2:
             return 0.0
         
-        # Use TF-IDF to calculate similarity
-        vectorizer = TfidfVectorizer(analyzer='char', ngram_range=(2, 4))
+        # Same TF-IDF cosine as the template index, with the IDF fitted on
+        # both lists so neither side's n-grams are dropped
+        counts = _FIELD_COUNTER.transform(fields1 + fields2)
+        vectors = TfidfTransformer(norm='l2').fit_transform(counts)
+        similarity_matrix = vectors[:len(fields1)] @ vectors[len(fields1):].T
         
-        try:
-            all_fields = fields1 + fields2
-            tfidf_matrix = vectorizer.fit_transform(all_fields)
-            
-            # Calculate cosine similarity between the two sets
-            set1_vectors = tfidf_matrix[:len(fields1)]
-            set2_vectors = tfidf_matrix[len(fields1):]
-            
-            similarity_matrix = cosine_similarity(set1_vectors, set2_vectors)
-            
-            # Return average maximum similarity for each field
-            max_similarities = []
-            for i in range(len(fields1)):
-                max_sim = np.max(similarity_matrix[i])
-                max_similarities.append(max_sim)
-            
-            return float(np.mean(max_similarities))
-            
-        except:
-            # Fallback to simple string matching
-            matches = 0
-            for field1 in fields1:
-                for field2 in fields2:
-                    if field1.lower() == field2.lower():
-                        matches += 1
-                        break
-            
-            return matches / max(len(fields1), len(fields2))
+        # Return average maximum similarity for each field
+        return float(similarity_matrix.max(axis=1).toarray().mean())
     
     def _generate_template_id(
         self,
@@ -686,9 +1112,7 @@ class TemplateManager:
     ) -> str:
         """Generate unique template ID"""
         # Create hash from carrier, format, and field names
-        content = f"{carrier}_{format_type}_{'_'.join(sorted(field_candidates))}"
-        hash_object = hashlib.md5(content.encode())
-        return f"{carrier}_{format_type}_{hash_object.hexdigest()[:8]}"
+        return _template_id(carrier, format_type, tuple(sorted(field_candidates)))
     
     def _calculate_template_confidence(
         self,
@@ -702,7 +1126,7 @@ class TemplateManager:
         
         # Field mapping confidence (40%)
         field_confidences = [field.confidence for field in fields]
-        avg_field_confidence = np.mean(field_confidences)
+        avg_field_confidence = sum(field_confidences) / len(field_confidences)
         
         # Required field coverage (30%)
         required_fields = ["ts", "number", "type"]
@@ -768,6 +1192,11 @@ class TemplateManager:
         except Exception as e:
             logger.error("Failed to save template to database", error=str(e))
     
+    async def wait_for_pending_writes(self):
+        """Wait for background template database writes to finish"""
+        if self._pending_writes:
+            await asyncio.gather(*self._pending_writes, return_exceptions=True)
+    
     async def update_template_accuracy(
         self,
         template_id: str,
@@ -797,7 +1226,7 @@ class TemplateManager:
             elif accuracy < 0.7:
                 template.confidence = max(template.confidence * 0.9, 0.1)
             
-            self._save_templates()
+            self._save_template(template_id)
             
             logger.info(
                 "Template accuracy updated",
@@ -815,58 +1244,82 @@ class TemplateManager:
         carrier: str = "unknown"
     ) -> Dict[str, List[Dict[str, Any]]]:
         """Get suggestions for manual field mapping"""
+        field_mapper = self.field_mapper
+        
+        # Large candidate sets are split across threads; predict_proba's NumPy
+        # and sparse kernels release the GIL, so chunks overlap
+        workers = min(8, os.cpu_count() or 1)
+        if len(field_candidates) >= self.parallel_suggestion_min_candidates and workers > 1:
+            chunk_size = -(-len(field_candidates) // workers)
+            chunks = [
+                field_candidates[start:start + chunk_size]
+                for start in range(0, len(field_candidates), chunk_size)
+            ]
+            
+            suggestions = {}
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for chunk_suggestions in executor.map(
+                    lambda chunk: self._suggest_for_candidates(chunk, field_mapper), chunks
+                ):
+                    suggestions.update(chunk_suggestions)
+            return suggestions
+        
+        return self._suggest_for_candidates(field_candidates, field_mapper)
+    
+    def _suggest_for_candidates(
+        self,
+        field_candidates: List[str],
+        field_mapper
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """Build ranked ML and rule-based suggestions for a batch of candidates"""
         suggestions = {}
         
-        standard_fields = {
-            "ts": "Timestamp/Date",
-            "number": "Phone Number",
-            "duration": "Call Duration", 
-            "type": "Call/SMS Type",
-            "direction": "Call Direction",
-            "content": "Message Content",
-            "cost": "Cost/Charges",
-            "location": "Location/Area"
-        }
-        
-        for candidate in field_candidates:
+        # Get ML predictions for all candidates in one batch if available
+        probs_matrix = None
+        if field_mapper is not None and hasattr(field_mapper, 'classes_') and field_candidates:
+            try:
+                class_info = _class_display_info(tuple(field_mapper.classes_.tolist()))
+                probs_matrix = field_mapper.predict_proba([candidate.lower() for candidate in field_candidates])
+            except _PREDICT_ERRORS as e:
+                logger.warning("Field mapper suggestions failed", error=str(e))
+        
+        for row, candidate in enumerate(field_candidates):
             field_suggestions = []
             
-            # Get ML predictions if available
-            from .layout_classifier import layout_classifier
-            field_mapper = layout_classifier.models.get("field_mapper")
-            
-            if field_mapper:
-                try:
-                    probabilities = field_mapper.predict_proba([candidate.lower()])[0]
-                    classes = field_mapper.classes_
-                    
-                    # Get top 3 predictions
-                    top_indices = np.argsort(probabilities)[-3:][::-1]
-                    
-                    for idx in top_indices:
-                        if probabilities[idx] > 0.1:  # Only show reasonable suggestions
-                            field_suggestions.append({
-                                "target_field": classes[idx],
-                                "display_name": standard_fields.get(classes[idx], classes[idx]),
-                                "confidence": float(probabilities[idx]),
-                                "source": "ml_model"
-                            })
-                except:
-                    pass
+            if probs_matrix is not None:
+                probabilities = probs_matrix[row]
+                
+                # Get top 3 predictions; argpartition avoids sorting every class
+                if len(probabilities) > 3:
+                    top_indices = np.argpartition(probabilities, -3)[-3:]
+                    top_indices = top_indices[np.argsort(probabilities[top_indices])[::-1]]
+                else:
+                    top_indices = np.argsort(probabilities)[::-1]
+                
+                # Only show reasonable suggestions; filter in NumPy before iterating
+                top_probs = probabilities[top_indices]
+                keep = top_probs > 0.1
+                for idx, prob in zip(top_indices[keep].tolist(), top_probs[keep].tolist()):
+                    target_field, display_name = class_info[idx]
+                    field_suggestions.append({
+                        "target_field": target_field,
+                        "display_name": display_name,
+                        "confidence": prob,
+                        "source": "ml_model"
+                    })
             
             # Add rule-based suggestions
             rule_prediction, rule_confidence = self._rule_based_field_mapping(candidate)
             if rule_prediction != "unknown":
                 field_suggestions.append({
                     "target_field": rule_prediction,
-                    "display_name": standard_fields.get(rule_prediction, rule_prediction),
+                    "display_name": STANDARD_FIELDS.get(rule_prediction, rule_prediction),
                     "confidence": rule_confidence,
                     "source": "rule_based"
                 })
             
-            # Sort by confidence
-            field_suggestions.sort(key=lambda x: x["confidence"], reverse=True)
-            suggestions[candidate] = field_suggestions[:3]  # Top 3 suggestions
+            # Top 3 suggestions by confidence
+            suggestions[candidate] = heapq.nlargest(3, field_suggestions, key=itemgetter("confidence"))
         
         return suggestions
 
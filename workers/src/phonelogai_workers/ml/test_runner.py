@@ -11,12 +11,21 @@ This script runs comprehensive tests and validation for the ML system:
 
 import asyncio
 import argparse
+import io
 import json
+import sys
+import dataclasses
+from enum import Enum
 from pathlib import Path
-from datetime import datetime
+from datetime import date, datetime
 import structlog
 
-from .validation_suite import ml_validation_suite
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from .validation_suite import ml_validation_suite, PerformanceTestResult, ValidationResult
 from .layout_classifier import layout_classifier
 from .template_manager import template_manager
 from .performance_optimizer import performance_profiler
@@ -24,6 +33,9 @@ from ..config import settings
 
 logger = structlog.get_logger(__name__)
 
+# Leaf types the json module encodes natively
+_JSON_SCALAR = (str, int, float, bool, type(None))
+
 
 async def main():
     """Main test runner function"""
@@ -101,112 +113,172 @@ async def main():
     except Exception as e:
         logger.error(f"Test runner failed: {str(e)}")
         return 3
+    
+    finally:
+        # Template discovery saves to the database in the background;
+        # asyncio.run would cancel those writes when main returns
+        await template_manager.wait_for_pending_writes()
 
 
 def print_test_summary(results: dict):
     """Print formatted test summary"""
     
-    print("\\n" + "="*60)
-    print("ML LAYOUT CLASSIFICATION SYSTEM - TEST RESULTS")
-    print("="*60)
+    # Build the report in memory and emit it with a single write
+    buf = io.StringIO()
+    
+    print("\\n" + "="*60, file=buf)
+    print("ML LAYOUT CLASSIFICATION SYSTEM - TEST RESULTS", file=buf)
+    print("="*60, file=buf)
     
     # Overall score
     overall_score = results.get("overall_score", 0.0)
-    print(f"Overall Score: {overall_score:.2f}/1.00 ({overall_score*100:.1f}%)")
+    print(f"Overall Score: {overall_score:.2f}/1.00 ({overall_score*100:.1f}%)", file=buf)
     
     # Execution time
     exec_time = results.get("total_execution_time_seconds", 0)
-    print(f"Total Execution Time: {exec_time:.1f} seconds")
+    print(f"Total Execution Time: {exec_time:.1f} seconds", file=buf)
     
-    print("\\n" + "-"*60)
+    print("\\n" + "-"*60, file=buf)
     
     # Model validation results
     if "model_validation" in results:
-        print("MODEL VALIDATION RESULTS:")
+        print("MODEL VALIDATION RESULTS:", file=buf)
         model_results = results["model_validation"]
         
         for model_name, result in model_results.items():
-            if hasattr(result, 'success') and result.success:
-                print(f"  {model_name:20}: ✓ Accuracy: {result.accuracy:.3f}, Precision: {result.precision:.3f}, Recall: {result.recall:.3f}")
+            if isinstance(result, ValidationResult) and result.success:
+                print(f"  {model_name.ljust(20)}: ✓ Accuracy: {result.accuracy:.3f}, Precision: {result.precision:.3f}, Recall: {result.recall:.3f}", file=buf)
             else:
-                error_msg = getattr(result, 'error_message', 'Unknown error')
-                print(f"  {model_name:20}: ✗ Error: {error_msg}")
+                error_msg = result.error_message if isinstance(result, ValidationResult) else 'Unknown error'
+                print(f"  {model_name.ljust(20)}: ✗ Error: {error_msg}", file=buf)
     
     # Template validation results
     if "template_validation" in results:
-        print("\\nTEMPLATE SYSTEM VALIDATION:")
+        print("\\nTEMPLATE SYSTEM VALIDATION:", file=buf)
         template_results = results["template_validation"]
         
         for test_name, success in template_results.items():
             if test_name not in ["overall_success", "errors"]:
                 status = "✓" if success else "✗"
-                print(f"  {test_name.replace('_', ' ').title():25}: {status}")
+                print(f"  {test_name.replace('_', ' ').title().ljust(25)}: {status}", file=buf)
         
         if template_results.get("errors"):
-            print("  Errors:")
+            print("  Errors:", file=buf)
             for error in template_results["errors"]:
-                print(f"    - {error}")
+                print(f"    - {error}", file=buf)
     
     # Performance validation results
     if "performance_validation" in results:
-        print("\\nPERFORMANCE VALIDATION:")
+        print("\\nPERFORMANCE VALIDATION:", file=buf)
         perf_results = results["performance_validation"]
         
         for test_name, result in perf_results.items():
-            if hasattr(result, 'target_met'):
+            if isinstance(result, PerformanceTestResult):
                 status = "✓" if result.target_met else "✗"
                 throughput = result.throughput_rows_per_sec
                 memory = result.memory_peak_mb
-                print(f"  {test_name.replace('_', ' ').title():20}: {status} {throughput:.0f} rows/sec, {memory:.1f} MB peak")
+                print(f"  {test_name.replace('_', ' ').title().ljust(20)}: {status} {throughput:.0f} rows/sec, {memory:.1f} MB peak", file=buf)
     
     # Integration test results
     if "integration_tests" in results:
-        print("\\nINTEGRATION TESTS:")
+        print("\\nINTEGRATION TESTS:", file=buf)
         integration_results = results["integration_tests"]
         
         for test_name, success in integration_results.items():
             if test_name not in ["overall_success", "errors"]:
                 status = "✓" if success else "✗"
-                print(f"  {test_name.replace('_', ' ').title():25}: {status}")
+                print(f"  {test_name.replace('_', ' ').title().ljust(25)}: {status}", file=buf)
         
         if integration_results.get("errors"):
-            print("  Errors:")
+            print("  Errors:", file=buf)
             for error in integration_results["errors"]:
-                print(f"    - {error}")
+                print(f"    - {error}", file=buf)
+    
+    sys.stdout.write(buf.getvalue())
 
 
 def save_results_to_file(results: dict, filename: str):
     """Save test results to JSON file"""
     
-    # Convert any non-serializable objects
-    serializable_results = _make_serializable(results)
-    
     output_path = Path(filename)
     output_path.parent.mkdir(parents=True, exist_ok=True)
     
+    # Non-serializable objects are converted lazily by the encoders' default
+    # hook, so only those subtrees are copied rather than the whole result tree
+    if orjson is not None:
+        output_path.write_bytes(orjson.dumps(
+            results,
+            option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+            default=_make_serializable
+        ))
+        return
+    
+    encoder = json.JSONEncoder(indent=2, default=_make_serializable)
     with open(output_path, 'w') as f:
-        json.dump(serializable_results, f, indent=2, default=str)
+        for chunk in encoder.iterencode(results):
+            f.write(chunk)
 
 
 def _make_serializable(obj):
     """Make object JSON serializable"""
     
-    if hasattr(obj, '__dict__'):
-        # Convert dataclass or object to dict
-        return {key: _make_serializable(value) for key, value in obj.__dict__.items()}
-    elif isinstance(obj, dict):
-        return {key: _make_serializable(value) for key, value in obj.items()}
-    elif isinstance(obj, list):
-        return [_make_serializable(item) for item in obj]
-    elif isinstance(obj, tuple):
-        return [_make_serializable(item) for item in obj]
-    else:
-        # Try to convert to string if not serializable
+    # Walk with an explicit stack of (container, key, value, depth) slots to
+    # fill, so deep result trees cost no Python frame per level; the depth cap
+    # keeps a reference cycle from looping forever
+    max_depth = sys.getrecursionlimit()
+    root = [None]
+    stack = [(root, 0, obj, 0)]
+    
+    while stack:
+        parent, key, value, depth = stack.pop()
+        if depth > max_depth:
+            raise ValueError("Object too deeply nested to serialize (possible reference cycle)")
+        
+        if isinstance(value, dict):
+            items = value
+        elif isinstance(value, (list, tuple)):
+            out = [None] * len(value)
+            parent[key] = out
+            stack.extend((out, index, item, depth + 1) for index, item in enumerate(value))
+            continue
+        elif dataclasses.is_dataclass(value) and not isinstance(value, type):
+            # Declared fields only; works for slotted dataclasses too
+            items = {field.name: getattr(value, field.name) for field in dataclasses.fields(value)}
+        elif isinstance(value, Enum):
+            stack.append((parent, key, value.value, depth + 1))
+            continue
+        elif hasattr(value, '__dict__') and not isinstance(value, type):
+            # Last resort for plain objects
+            items = value.__dict__
+        else:
+            parent[key] = _serializable_leaf(value)
+            continue
+        
+        # Pre-seed keys so the output keeps the input's key order
+        out = dict.fromkeys(items)
+        parent[key] = out
+        stack.extend((out, item_key, item, depth + 1) for item_key, item in items.items())
+    
+    return root[0]
+
+
+def _serializable_leaf(obj):
+    """Return a scalar as-is if JSON can encode it, else its string form"""
+    if isinstance(obj, _JSON_SCALAR):
+        return obj
+    
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    
+    # NumPy scalars convert losslessly to the matching Python scalar
+    if hasattr(obj, 'item'):
         try:
-            json.dumps(obj)
-            return obj
+            return obj.item()
         except (TypeError, ValueError):
-            return str(obj)
+            pass
+    
+    # Try to convert to string if not serializable
+    return str(obj)
 
 
 def run_quick_smoke_test():
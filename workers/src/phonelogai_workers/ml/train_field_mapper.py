@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Offline training entry point for the field mapping model
+
+Workers only load the saved field mapper at startup; run this once per
+deployment (or after changing the training vocabulary) to fit and save it:
+
+    python -m phonelogai_workers.ml.train_field_mapper
+"""
+
+import sys
+
+from .layout_classifier import layout_classifier
+
+
+def main():
+    """Fit the field mapper and save it to the model cache"""
+    
+    print("Building field mapper training data...")
+    training_data, labels = layout_classifier._build_field_mapper_training_data()
+    print(f"Samples: {len(training_data)}, Classes: {len(set(labels))}")
+    
+    try:
+        layout_classifier._fit_and_save_field_mapper(training_data, labels)
+    except Exception as e:
+        print(f"✗ field_mapper training failed: {str(e)}")
+        return 1
+    
+    print("✓ field_mapper trained and saved")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -186,15 +186,24 @@ def _run_enhanced_classification(
             format_type=detected_format,
             confidence_threshold=0.7
         )
+        # Persist the usage bump before the task returns instead of waiting
+        # for the debounce timer, which a killed worker would never run
+        template_manager.flush_templates()
     
     # Step 3: If no template found and confidence is high, discover new template
     if not template and classification["confidence"] > 0.8:
-        template = asyncio.run(template_manager.discover_template(
-            file_content=file_content,
-            detected_carrier=carrier,
-            detected_format=detected_format,
-            job_id=job_id
-        ))
+        async def discover_and_persist():
+            discovered = await template_manager.discover_template(
+                file_content=file_content,
+                detected_carrier=carrier,
+                detected_format=detected_format,
+                job_id=job_id
+            )
+            # asyncio.run cancels leftover tasks, so let the DB write land first
+            await template_manager.wait_for_pending_writes()
+            return discovered
+        
+        template = asyncio.run(discover_and_persist())
     
     # Step 4: Use template if available
     if template:
@@ -0,0 +1,14 @@
+"""
+Shared fixtures for the workers test suite
+"""
+import pytest
+
+from phonelogai_workers.config import settings
+from phonelogai_workers.ml.template_manager import TemplateManager
+
+
+@pytest.fixture
+def template_manager(tmp_path, monkeypatch):
+    """TemplateManager backed by an empty, per-test template cache directory"""
+    monkeypatch.setattr(settings, "model_cache_dir", str(tmp_path))
+    return TemplateManager()
@@ -0,0 +1,136 @@
+"""
+Tests for the layout classifier: batching, model persistence and column typing
+"""
+import stat
+
+import joblib
+import pytest
+
+from phonelogai_workers.config import settings
+from phonelogai_workers.ml.layout_classifier import _MODEL_FILE_MODE, layout_classifier as classifier
+
+
+DOCUMENTS = [
+    (
+        "Date,Time,Number Called,Minutes,Type\n"
+        "01/15/2024,10:30 AM,555-123-4567,5,Outgoing\n",
+        "verizon.csv"
+    ),
+    (
+        "AT&T Wireless Statement\nCall Detail\n"
+        "Date/Time Phone Number Duration Direction\n"
+        "01/15/2024 10:30:00 555-123-4567 5:00 Incoming\n",
+        "att_statement.pdf"
+    ),
+    ("date|phone|duration\n2024-01-15|5551234567|300\n", "export.txt"),
+    # The same content under another name is classified on its own
+    (
+        "Date,Time,Number Called,Minutes,Type\n"
+        "01/15/2024,10:30 AM,555-123-4567,5,Outgoing\n",
+        "other.csv"
+    ),
+]
+
+
+@pytest.fixture
+def layout_classifier():
+    """The shared classifier with empty classification and prediction caches"""
+    classifier._classification_cache.clear()
+    classifier._prediction_cache.clear()
+    yield classifier
+    classifier._classification_cache.clear()
+    classifier._prediction_cache.clear()
+
+
+@pytest.mark.asyncio
+async def test_batch_matches_single_classification(layout_classifier):
+    single = [
+        await layout_classifier.classify_layout(content, filename)
+        for content, filename in DOCUMENTS
+    ]
+    layout_classifier._classification_cache.clear()
+    layout_classifier._prediction_cache.clear()
+
+    contents, filenames = map(list, zip(*DOCUMENTS))
+    batch = await layout_classifier.classify_layout_batch(contents, filenames)
+
+    assert batch == single
+
+
+@pytest.mark.asyncio
+async def test_batch_results_are_copies_of_the_cache(layout_classifier):
+    contents, filenames = map(list, zip(*DOCUMENTS))
+    first = await layout_classifier.classify_layout_batch(contents, filenames)
+    first[0]["carrier"] = "changed"
+
+    second = await layout_classifier.classify_layout_batch(contents, filenames)
+
+    assert second[0]["carrier"] != "changed"
+    assert second[1:] == first[1:]
+
+
+@pytest.mark.asyncio
+async def test_batch_rejects_mismatched_lengths(layout_classifier):
+    with pytest.raises(ValueError):
+        await layout_classifier.classify_layout_batch(["a,b\n1,2\n"], [])
+
+
+@pytest.mark.asyncio
+async def test_empty_batch(layout_classifier):
+    assert await layout_classifier.classify_layout_batch([], []) == []
+
+
+def test_saved_model_follows_umask(layout_classifier, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "model_cache_dir", str(tmp_path))
+    try:
+        layout_classifier._save_model("test_model", {"weights": [1, 2, 3]})
+    finally:
+        layout_classifier.models.pop("test_model", None)
+    
+    saved = tmp_path / "test_model.joblib"
+    # Not the 0600 of the temp file it was written through
+    assert stat.S_IMODE(saved.stat().st_mode) == _MODEL_FILE_MODE
+    assert joblib.load(saved) == {"weights": [1, 2, 3]}
+    assert list(tmp_path.iterdir()) == [saved]
+
+
+@pytest.mark.parametrize("values, expected", [
+    (["1", "2.5", "-3", "1e3", "4"], "number"),
+    # float() parses all of these
+    (["nan", "NaN", "inf", "-Infinity", "1_000"], "number"),
+    ([" 7 ", "+5", ".5", "5.", "2.5E-3"], "number"),
+    # ...but not thousands separators or hex
+    (["1,000", "2,500", "3,000", "4,250", "5,000"], "string"),
+    (["0x1F", "0x2A", "0x10", "0xFF", "0x01"], "string"),
+    (["2024-01-15", "01/16/2024", "10:30", "2024-01-17", "11:45:00"], "date"),
+    (["", "  ", "1", "2"], "number"),
+    ([], "string"),
+])
+def test_infer_column_type_follows_float_parsing(layout_classifier, values, expected):
+    assert layout_classifier._infer_column_type(values) == expected
+
+
+@pytest.mark.asyncio
+async def test_repeated_classification_is_served_from_cache(layout_classifier, monkeypatch):
+    contents, filenames = map(list, zip(*DOCUMENTS))
+    first = await layout_classifier.classify_layout_batch(contents, filenames)
+    
+    classified = []
+    classify_context = layout_classifier._classify_context
+    monkeypatch.setattr(
+        layout_classifier, "_classify_context",
+        lambda ctx, filename, *args: classified.append(filename) or classify_context(ctx, filename, *args)
+    )
+    
+    # A warm run, through either entrypoint, runs no model inference
+    assert await layout_classifier.classify_layout_batch(contents, filenames) == first
+    assert [
+        await layout_classifier.classify_layout(content, filename)
+        for content, filename in DOCUMENTS
+    ] == first
+    assert classified == []
+    
+    # Retrained models invalidate the cached results
+    monkeypatch.setattr(layout_classifier, "_model_version", layout_classifier._model_version + 1)
+    await layout_classifier.classify_layout(*DOCUMENTS[0])
+    assert classified == [DOCUMENTS[0][1]]
@@ -0,0 +1,71 @@
+"""
+Tests for DataFrame memory optimization and shared-memory transfer
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from phonelogai_workers.ml.performance_optimizer import (
+    MemoryOptimizer, _frame_from_shared_memory, _frame_to_shared_memory, _release_shared_blocks
+)
+
+
+@pytest.fixture
+def memory_optimizer():
+    return MemoryOptimizer()
+
+
+def test_small_frames_are_optimized(memory_optimizer):
+    df = pd.DataFrame({
+        "duration": np.arange(10, dtype=np.int64),
+        "direction": ["Inbound", "Outbound"] * 5,
+        "number": [f"555000{i:04d}" for i in range(10)],
+    })
+    
+    optimized = memory_optimizer.optimize_pandas_dtypes(df)
+    
+    assert optimized["duration"].dtype == np.int8
+    assert isinstance(optimized["direction"].dtype, pd.CategoricalDtype)
+    # All values unique: left as strings
+    assert not isinstance(optimized["number"].dtype, pd.CategoricalDtype)
+
+
+def test_empty_frame_is_left_as_is(memory_optimizer):
+    df = pd.DataFrame({"direction": pd.Series([], dtype=object)})
+    
+    optimized = memory_optimizer.optimize_pandas_dtypes(df)
+    
+    assert not isinstance(optimized["direction"].dtype, pd.CategoricalDtype)
+
+
+def test_categories_match_pandas_conversion(memory_optimizer):
+    # First appearance order differs from sorted order, with nulls
+    values = ["Voice", "SMS", None, "MMS", "SMS", "Voice", None, "SMS"] * 4
+    df = pd.DataFrame({"call_type": pd.Series(values, dtype=object)}, index=np.arange(32) * 3)
+    expected = df["call_type"].astype("category")
+    
+    optimized = memory_optimizer.optimize_pandas_dtypes(df)
+    
+    pd.testing.assert_series_equal(optimized["call_type"], expected)
+    assert list(optimized["call_type"].cat.categories) == ["MMS", "SMS", "Voice"]
+
+
+def test_frame_round_trips_through_shared_memory():
+    pytest.importorskip("pyarrow")
+    df = pd.DataFrame(
+        {"duration": np.arange(5, dtype=np.int64), "direction": ["Inbound", "Outbound"] * 2 + ["Inbound"]},
+        index=np.arange(5) * 2
+    )
+    
+    shm, handle = _frame_to_shared_memory(df)
+    try:
+        rebuilt = _frame_from_shared_memory(handle)
+    finally:
+        # No Arrow view of the block may outlive the copy
+        _release_shared_blocks([shm])
+    
+    pd.testing.assert_frame_equal(rebuilt, df)
+    if os.path.isdir("/dev/shm"):
+        assert not os.path.exists(f"/dev/shm/{handle.name.lstrip('/')}")
@@ -0,0 +1,250 @@
+"""
+Tests for carrier template matching and storage
+"""
+import asyncio
+import gc
+import time
+import weakref
+from typing import List
+
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer, TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+
+from phonelogai_workers.ml.template_manager import (
+    CarrierTemplate, TemplateField, TemplateManager, _Context, _flush_live_managers
+)
+
+
+TEMPLATE_FIELDS = ["call_date", "phone_number", "duration", "direction", "call_type"]
+
+
+def make_template(template_id: str, field_names: List[str], carrier: str = "att") -> CarrierTemplate:
+    """Minimal CSV template with the given source field names"""
+    return CarrierTemplate(
+        template_id=template_id,
+        carrier=carrier,
+        format_type="csv",
+        version="1.0",
+        confidence=0.9,
+        fields=[
+            TemplateField(
+                source_name=name,
+                target_field="unknown",
+                data_type="string",
+                is_required=False,
+                confidence=0.5
+            )
+            for name in field_names
+        ],
+        table_structure={},
+        validation_rules=[],
+        sample_headers=list(field_names),
+        created_at="2024-01-01T00:00:00+00:00",
+        last_updated="2024-01-01T00:00:00+00:00"
+    )
+
+
+def baseline_similarity(fields1: List[str], fields2: List[str]) -> float:
+    """Original field similarity: TF-IDF fitted on both lists, mean of row-max cosine"""
+    vectorizer = TfidfVectorizer(analyzer='char', ngram_range=(2, 4))
+    tfidf_matrix = vectorizer.fit_transform(fields1 + fields2)
+    similarity_matrix = cosine_similarity(tfidf_matrix[:len(fields1)], tfidf_matrix[len(fields1):])
+    return float(np.mean(similarity_matrix.max(axis=1)))
+
+
+def indexed_similarity(manager, template_id: str, field_candidates: List[str]) -> float:
+    """Similarity find_matching_template computes against a precomputed template matrix"""
+    query = manager._field_vectors(field_candidates)
+    sims = query @ manager._field_matrices[template_id].T
+    return float(sims.max(axis=1).toarray().mean())
+
+
+def reference_indexed_similarity(template_fields: List[str], field_candidates: List[str]) -> float:
+    """Indexed similarity rebuilt from the original vectorizer's components
+    
+    IDF is fitted on the template's names only, but the vocabulary also holds
+    the query's n-grams, so unseen ones keep the maximum IDF instead of being
+    dropped from the query.
+    """
+    counter = CountVectorizer(analyzer='char', ngram_range=(2, 4))
+    counter.fit(template_fields + field_candidates)
+    tfidf = TfidfTransformer().fit(counter.transform(template_fields))
+    similarity_matrix = cosine_similarity(
+        tfidf.transform(counter.transform(field_candidates)),
+        tfidf.transform(counter.transform(template_fields))
+    )
+    return float(np.mean(similarity_matrix.max(axis=1)))
+
+
+FIELD_CANDIDATES = [
+    # Known columns with unseen suffixes
+    ["call_date_local_time", "phone_number_called", "duration_secs", "direction", "call_type"],
+    # Half the columns are new to every template
+    ["call_date", "phone_number", "duration", "roaming_zone", "tower_id", "billing_code"],
+    # Same meaning, different spelling
+    ["date_of_call", "number_dialed", "minutes", "in_out", "usage_category"],
+    # Separators and case only
+    ["Date/Time", "Phone Number", "Duration"],
+    ["call date", "phone number", "duration", "direction", "call type"],
+]
+
+
+@pytest.mark.parametrize("field_candidates", FIELD_CANDIDATES)
+def test_unseen_ngrams_do_not_inflate_indexed_similarity(template_manager, field_candidates):
+    template_manager._register_template(make_template("att_csv_1", TEMPLATE_FIELDS))
+    template_manager._fit_field_vectorizer()
+    
+    score = indexed_similarity(template_manager, "att_csv_1", field_candidates)
+    
+    # Dropping unseen n-grams from the query scored such lists 0.1-0.2 higher
+    assert score == pytest.approx(reference_indexed_similarity(TEMPLATE_FIELDS, field_candidates), abs=1e-9)
+
+
+@pytest.mark.parametrize("field_candidates", FIELD_CANDIDATES)
+def test_field_similarity_matches_original_vectorizer(template_manager, field_candidates):
+    score = template_manager._calculate_field_similarity(field_candidates, TEMPLATE_FIELDS)
+    
+    assert score == pytest.approx(baseline_similarity(field_candidates, TEMPLATE_FIELDS), abs=1e-9)
+
+
+def test_identical_headers_score_one(template_manager):
+    template_manager._register_template(make_template("att_csv_1", TEMPLATE_FIELDS))
+    template_manager._fit_field_vectorizer()
+    
+    assert indexed_similarity(template_manager, "att_csv_1", TEMPLATE_FIELDS) == pytest.approx(1.0)
+
+
+def test_field_similarity_scale_does_not_depend_on_list_length(template_manager):
+    candidates = ["date_of_call", "phone_number", "duration_secs", "direction", "usage_category"]
+    
+    short = template_manager._calculate_field_similarity(candidates, TEMPLATE_FIELDS)
+    # Same lists repeated past the size where a different metric used to take over
+    long = template_manager._calculate_field_similarity(candidates * 60, TEMPLATE_FIELDS * 60)
+    
+    assert long == pytest.approx(short, abs=0.02)
+
+
+@pytest.mark.parametrize("value", [
+    "42", "-3.5", "+5", "1e5", "2.5E-3", ".5", "5.", "1,234.56", "1_000", " 7 ", "inf", "NaN",
+    "", "-", "1.2.3", "e5", "12abc", "0x1F", "1e", "--5",
+])
+def test_is_numeric_matches_float_parsing(template_manager, value):
+    try:
+        float(value.replace(',', ''))
+        expected = True
+    except ValueError:
+        expected = False
+    
+    assert template_manager._is_numeric(value) is expected
+
+
+def test_saved_template_reloads_from_its_own_file(template_manager):
+    template = make_template("att_csv_1", TEMPLATE_FIELDS)
+    template_manager._register_template(template)
+    template_manager._save_template(template.template_id)
+    
+    assert (template_manager.template_dir / "att_csv_1.json").exists()
+    
+    reloaded = TemplateManager()
+    assert reloaded.templates["att_csv_1"].to_dict() == template.to_dict()
+
+
+def test_usage_bumps_are_flushed_without_another_bump(template_manager):
+    template = make_template("att_csv_1", TEMPLATE_FIELDS)
+    template_manager._register_template(template)
+    template_manager._save_template(template.template_id)
+    template_manager.usage_flush_interval_seconds = 0.2
+    template_manager._last_usage_flush = time.monotonic()
+    
+    template_manager._mark_template_used(template)
+    assert template_manager._dirty_templates == {"att_csv_1"}
+    template_manager._flush_timer.join(timeout=5)
+    
+    assert not template_manager._dirty_templates
+    assert TemplateManager().templates["att_csv_1"].usage_count == 1
+
+
+def test_flush_templates_persists_pending_usage(template_manager):
+    template = make_template("att_csv_1", TEMPLATE_FIELDS)
+    template_manager._register_template(template)
+    
+    template_manager._mark_template_used(template)
+    template_manager._mark_template_used(template)
+    template_manager.flush_templates()
+    
+    assert TemplateManager().templates["att_csv_1"].usage_count == 2
+
+
+@pytest.mark.asyncio
+async def test_field_data_type_agrees_with_stored_samples(template_manager):
+    # Numeric in the sampled leading rows, text for the rest of the head
+    rows = [f"2024-01-{day:02d},{day * 1.5}" for day in range(1, 6)]
+    rows += [f"2024-02-{day:02d},pending" for day in range(1, 29)]
+    ctx = _Context.from_content("call_date,amount\n" + "\n".join(rows) + "\n")
+    ctx.delimiter = ","
+    ctx.parse_head(",")
+    
+    fields = await template_manager._generate_template_fields(["call_date", "amount"], "att", ctx)
+    amount = next(field for field in fields if field.source_name == "amount")
+    
+    assert amount.sample_values == ["1.5", "3.0", "4.5", "6.0", "7.5"]
+    assert amount.data_type == "number"
+
+
+def test_discovered_template_is_saved_before_the_loop_closes(template_manager, monkeypatch):
+    saved = []
+    
+    async def save_template_to_db(template, job_id):
+        await asyncio.sleep(0.05)
+        saved.append((template.template_id, job_id))
+    
+    monkeypatch.setattr(template_manager, "_save_template_to_db", save_template_to_db)
+    content = "call_date,phone_number,duration\n2024-01-15,5551234567,300\n2024-01-16,5559876543,45\n"
+    
+    async def main():
+        template = await template_manager.discover_template(content, "att", "csv", job_id="job_1")
+        await template_manager.wait_for_pending_writes()
+        return template
+    
+    template = asyncio.run(main())
+    
+    assert saved == [(template.template_id, "job_1")]
+
+
+@pytest.mark.parametrize("content", [
+    "call_date,phone_number\r\n2024-01-15,5551234567\r\n",
+    "call_date,phone_number\n2024-01-15,5551234567\n",
+    "call_date\x0cphone_number\n2024-01-15 5551234567",
+    "",
+])
+def test_context_splits_lines_like_the_original_parser(content):
+    ctx = _Context.from_content(content)
+    
+    assert ctx.lines == content.split('\n')
+    assert ctx.header_line == content.split('\n')[0]
+
+
+def test_managers_are_not_kept_alive_for_exit_flush(template_manager):
+    manager = TemplateManager()
+    ref = weakref.ref(manager)
+    
+    del manager
+    gc.collect()
+    
+    assert ref() is None
+
+
+def test_exit_flush_writes_pending_usage(template_manager):
+    template = make_template("att_csv_1", TEMPLATE_FIELDS)
+    template_manager._register_template(template)
+    template_manager.usage_flush_interval_seconds = 3600
+    template_manager._last_usage_flush = time.monotonic()
+    template_manager._mark_template_used(template)
+    template_manager._flush_timer.cancel()
+    
+    _flush_live_managers()
+    
+    assert not template_manager._dirty_templates
+    assert TemplateManager().templates["att_csv_1"].usage_count == 1
@@ -0,0 +1,117 @@
+"""
+Tests for the validation suite's classification metrics and test data
+"""
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.metrics import (
+    accuracy_score, confusion_matrix, f1_score, precision_score, recall_score
+)
+
+from phonelogai_workers.config import settings
+from phonelogai_workers.ml.validation_suite import MLValidationSuite, _metrics_from_labels
+
+
+def sklearn_metrics(y_true, y_pred):
+    """The scores _metrics_from_labels replaces, as the suite used to compute them"""
+    kwargs = {"average": "weighted", "zero_division": 0}
+    return (
+        accuracy_score(y_true, y_pred),
+        precision_score(y_true, y_pred, **kwargs),
+        recall_score(y_true, y_pred, **kwargs),
+        f1_score(y_true, y_pred, **kwargs),
+        confusion_matrix(y_true, y_pred)
+    )
+
+
+def assert_matches_sklearn(y_true, y_pred):
+    accuracy, precision, recall, f1, matrix = _metrics_from_labels(y_true, y_pred)
+    expected = sklearn_metrics(y_true, y_pred)
+
+    assert (accuracy, precision, recall, f1) == pytest.approx(expected[:4], abs=1e-12)
+    np.testing.assert_array_equal(matrix, expected[4])
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_metrics_match_sklearn_on_random_labels(seed):
+    rng = np.random.default_rng(seed)
+    labels = np.array(["att", "verizon", "tmobile", "sprint", "unknown"])
+    size = int(rng.integers(1, 200))
+    y_true = list(rng.choice(labels[:int(rng.integers(1, 6))], size))
+    y_pred = list(rng.choice(labels[:int(rng.integers(1, 6))], size))
+
+    assert_matches_sklearn(y_true, y_pred)
+
+
+@pytest.mark.parametrize("y_true, y_pred", [
+    # "txt" is never predicted: its precision is 0/0
+    (["pdf", "csv", "txt", "txt"], ["pdf", "csv", "csv", "pdf"]),
+    # "txt" is predicted but never true: it has no support and no weight
+    (["pdf", "csv", "csv", "pdf"], ["pdf", "txt", "csv", "txt"]),
+    # No prediction is right: every F1 is 0/0
+    (["pdf", "csv", "txt"], ["csv", "txt", "pdf"]),
+    # One class only
+    (["csv"] * 5, ["csv"] * 5),
+])
+def test_metrics_match_sklearn_with_zero_division(y_true, y_pred):
+    assert_matches_sklearn(y_true, y_pred)
+
+
+@pytest.fixture
+def validation_suite(tmp_path, monkeypatch):
+    """MLValidationSuite writing its test data under a per-test directory"""
+    monkeypatch.setattr(settings, "model_cache_dir", str(tmp_path))
+    return MLValidationSuite()
+
+
+@pytest.mark.parametrize("rows", [0, 1, 20, 21])
+def test_generated_test_csv_is_written_in_chunks(validation_suite, rows):
+    validation_suite.test_csv_chunk_rows = 7
+    
+    path = validation_suite._generate_test_csv_file(rows)
+    try:
+        df = pd.read_csv(path)
+        assert list(df.columns) == ["Date/Time", "Phone Number", "Duration", "Direction", "Call Type"]
+        assert len(df) == rows
+        assert validation_suite._count_test_csv_rows(path) == rows
+        assert len(validation_suite._read_test_csv(path)) == rows
+    finally:
+        path.unlink()
+    
+    assert not any(validation_suite.test_data_dir.iterdir())
+
+
+@pytest.mark.asyncio
+async def test_phases_run_one_at_a_time(validation_suite, monkeypatch):
+    running, order = [], []
+    
+    def phase(name, error=None):
+        async def run():
+            assert not running, f"{name} overlapped {running}"
+            running.append(name)
+            await asyncio.sleep(0)
+            running.remove(name)
+            order.append(name)
+            if error:
+                raise error
+            return {"phase": name}
+        return run
+    
+    monkeypatch.setattr(validation_suite, "_validate_ml_models", phase("models"))
+    monkeypatch.setattr(validation_suite, "_validate_template_system", phase("templates", RuntimeError("broken")))
+    monkeypatch.setattr(validation_suite, "_validate_performance", phase("performance"))
+    monkeypatch.setattr(validation_suite, "_run_integration_tests", phase("integration"))
+    monkeypatch.setattr(validation_suite, "_calculate_overall_score", lambda results: 0.0)
+    monkeypatch.setattr(validation_suite, "_generate_recommendations", lambda results: [])
+    
+    results = await validation_suite.run_full_validation_suite()
+    
+    assert order == ["models", "templates", "performance", "integration"]
+    assert results["model_validation"] == {"phase": "models"}
+    assert results["template_validation"] == {}
+    assert results["performance_validation"] == {"phase": "performance"}
+    assert results["integration_tests"] == {"phase": "integration"}
+    assert results["phase_errors"] == {"template_validation": "broken"}
+    assert results["success"] is False